@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Generator benchmark - throughput and variety of the parametric math question bank
+
+Usage: python benchmarks/math_generator.py [--batch 10000] [--rounds 5]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from study_server import MATH_TEMPLATES, ParametricMathBank  # noqa: E402
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=10_000, help="questions generated per call")
+    parser.add_argument("--rounds", type=int, default=5, help="most batches per difficulty (each bank has a fixed size)")
+    args = parser.parse_args()
+
+    bank = ParametricMathBank(args.batch * args.rounds)
+    bank.generate("easy", range(10))  # warm up the NumPy import
+    print(f"{'difficulty':<10} {'questions':>10} {'q/s':>10} {'unique':>8}")
+    for difficulty in MATH_TEMPLATES:
+        texts = set()
+        total = bank.size(difficulty)
+        start = time.perf_counter()
+        for begin in range(0, total, args.batch):
+            questions = bank.generate(difficulty, range(begin, min(begin + args.batch, total)))
+            texts.update(question for question, _, _, _ in questions)
+        elapsed = time.perf_counter() - start
+        print(f"{difficulty:<10} {total:>10,} {total / elapsed:>10,.0f} {len(texts) / total:>8.1%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Memory benchmark - compare the tuple question layout with the compact QuestionTable
+
+Usage: python benchmarks/question_memory.py [--count 200000]
+"""
+import os
+import sys
+import gc
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from study_server import QUESTION_BANKS, QuestionTable  # noqa: E402
+
+def synthetic_banks(count):
+    """Grow the built-in banks to `count` questions with unique question/explanation text"""
+    seeds = [(subject, difficulty, q_data)
+             for subject, bank in QUESTION_BANKS.items()
+             for difficulty, questions in bank.items()
+             for q_data in questions]
+    banks = {}
+    for i in range(count):
+        subject, difficulty, (question, choices, correct_idx, explanation) = seeds[i % len(seeds)]
+        # Fresh list and str objects per question, the way a parsed data file produces them
+        banks.setdefault(subject, {}).setdefault(difficulty, []).append(
+            (f"{question} (#{i})", [choice.encode().decode() for choice in choices],
+             correct_idx, f"{explanation} (#{i})"))
+    return banks
+
+def measure(build):
+    """Return (result, bytes still allocated by build())"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=200_000, help="number of questions to load")
+    args = parser.parse_args()
+
+    tuples, tuple_bytes = measure(lambda: synthetic_banks(args.count))
+    table, table_bytes = measure(lambda: QuestionTable.from_banks(tuples))
+    del tuples
+    assert len(table) == args.count
+
+    print(f"Questions:          {args.count:,}")
+    print(f"Tuple layout:       {tuple_bytes / 2**20:8.1f} MiB  ({tuple_bytes / args.count:6.1f} B/question)")
+    print(f"QuestionTable:      {table_bytes / 2**20:8.1f} MiB  ({table_bytes / args.count:6.1f} B/question)")
+    print(f"Reduction:          {tuple_bytes / table_bytes:8.1f}x")
+
+if __name__ == "__main__":
+    main()
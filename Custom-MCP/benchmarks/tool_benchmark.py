@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Tool benchmark - latency, throughput, memory and cold start for the study tools
+
+Modes:
+  inprocess  call the tool coroutines directly inside this process
+  stdio      drive study_server.py end to end as a stdio MCP subprocess
+
+Usage:
+  python benchmarks/tool_benchmark.py --mode inprocess --bank-sizes builtin,100000
+  python benchmarks/tool_benchmark.py --mode stdio --requests 200 --concurrency 8
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.join(BENCH_DIR, "..")
+SERVER_PATH = os.path.join(SERVER_DIR, "study_server.py")
+sys.path.insert(0, SERVER_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+TOPIC_MIXES = {
+    "single": ["math"],
+    "mixed": ["algebra", "biology", "world history", "grammar", "python programming"],
+}
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def peak_rss_mib(who=resource.RUSAGE_SELF):
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    scale = 2**20 if sys.platform == "darwin" else 2**10
+    return resource.getrusage(who).ru_maxrss / scale
+
+def build_scenarios(counts, mixes, resource_types):
+    """Return (name, tool, argument factory) for every scenario in the matrix"""
+    scenarios = []
+    for mix in mixes:
+        topics = TOPIC_MIXES[mix]
+        for count in counts:
+            scenarios.append((
+                f"questions count={count} topics={mix}", "generate_study_questions",
+                lambda i, topics=topics, count=count: {
+                    "topic": topics[i % len(topics)], "difficulty": "medium", "count": str(count)},
+            ))
+    for resource_type in resource_types:
+        scenarios.append((
+            f"resources type={resource_type}", "find_study_resources",
+            lambda i, resource_type=resource_type: {
+                "topic": TOPIC_MIXES["mixed"][i % len(TOPIC_MIXES["mixed"])], "resource_type": resource_type},
+        ))
+    return scenarios
+
+async def run_load(call, make_args, requests, concurrency):
+    """Issue `requests` calls from `concurrency` workers; return (sorted latencies, elapsed)"""
+    latencies = []
+    next_index = iter(range(requests))
+
+    async def worker():
+        for i in next_index:
+            start = time.perf_counter()
+            await call(make_args(i))
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return sorted(latencies), time.perf_counter() - start
+
+def report(mode, bank, name, latencies, elapsed, concurrency):
+    ms = [value * 1000 for value in latencies]
+    print(f"{mode:<9} {bank:>8} {name:<34} {len(ms):>6} {concurrency:>4} "
+          f"{percentile(ms, 50):>8.3f} {percentile(ms, 95):>8.3f} {percentile(ms, 99):>8.3f} "
+          f"{len(ms) / elapsed:>9.1f}")
+
+def print_header():
+    print(f"{'mode':<9} {'bank':>8} {'scenario':<34} {'calls':>6} {'conc':>4} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>9}")
+
+def synthetic_db(size, directory):
+    """Write a SQLite question file with `size` questions and return its path"""
+    import study_server
+    from question_memory import synthetic_banks
+    path = os.path.join(directory, f"bank_{size}.db")
+    study_server.write_question_db(path, (
+        (subject, difficulty, q_data)
+        for subject, bank in synthetic_banks(size).items()
+        for difficulty, questions in bank.items()
+        for q_data in questions))
+    return path
+
+async def bench_inprocess(args, scenarios):
+    import study_server
+    from question_memory import synthetic_banks
+    tools = {
+        "generate_study_questions": study_server.generate_study_questions,
+        "find_study_resources": study_server.find_study_resources,
+    }
+    builtin = study_server.knowledge
+    for bank in args.bank_sizes:
+        if bank == "builtin":
+            study_server.knowledge = builtin
+        else:
+            table = study_server.QuestionTable.from_banks(synthetic_banks(int(bank)))
+            study_server.knowledge = builtin._replace(store=study_server.InMemoryQuestionStore(table))
+        for name, tool, make_args in scenarios:
+            fn = tools[tool]
+            latencies, elapsed = await run_load(lambda kwargs: fn(**kwargs), make_args,
+                                                args.requests, args.concurrency)
+            report("inprocess", bank, name, latencies, elapsed, args.concurrency)
+    study_server.knowledge = builtin
+    print(f"\nPeak RSS (this process): {peak_rss_mib():.1f} MiB")
+
+async def bench_stdio(args, scenarios):
+    from mcp import ClientSession
+    from mcp.client.stdio import StdioServerParameters, stdio_client
+
+    cold_starts = []
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as devnull:
+        for bank in args.bank_sizes:
+            env = dict(os.environ, STUDY_SNAPSHOT=os.path.join(tmp, "no-snapshot"))
+            env.pop("STUDY_QUESTION_DB", None)
+            if bank != "builtin":
+                env["STUDY_QUESTION_DB"] = synthetic_db(int(bank), tmp)
+            params = StdioServerParameters(command=sys.executable, args=[SERVER_PATH], env=env)
+
+            # Cold starts without a snapshot, then with one built for this bank
+            snapshot = os.path.join(tmp, f"snapshot_{bank}.pickle")
+            subprocess.run([sys.executable, SERVER_PATH, "--build-snapshot", snapshot],
+                           env=env, stderr=devnull, check=True)
+            snapshot_params = StdioServerParameters(
+                command=sys.executable, args=[SERVER_PATH], env=dict(env, STUDY_SNAPSHOT=snapshot))
+            for variant, launch in (("no snapshot", params), ("snapshot", snapshot_params)):
+                for _ in range(args.cold_starts):
+                    start = time.perf_counter()
+                    async with stdio_client(launch, errlog=devnull) as (read, write):
+                        async with ClientSession(read, write) as session:
+                            await session.initialize()
+                            cold_starts.append((bank, variant, time.perf_counter() - start))
+
+            async with stdio_client(params, errlog=devnull) as (read, write):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    for name, tool, make_args in scenarios:
+                        async def call(kwargs, tool=tool):
+                            result = await session.call_tool(tool, kwargs)
+                            if result.isError:
+                                raise RuntimeError(result.content[0].text)
+                        latencies, elapsed = await run_load(call, make_args, args.requests, args.concurrency)
+                        report("stdio", bank, name, latencies, elapsed, args.concurrency)
+
+    print()
+    for bank in args.bank_sizes:
+        for variant in ("no snapshot", "snapshot"):
+            times = sorted(t * 1000 for b, v, t in cold_starts if b == bank and v == variant)
+            if times:
+                print(f"Cold start to initialized ({bank}, {variant}): median {percentile(times, 50):.1f} ms, "
+                      f"max {times[-1]:.1f} ms over {len(times)} launches")
+    print(f"Peak RSS (largest server process): {peak_rss_mib(resource.RUSAGE_CHILDREN):.1f} MiB")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["inprocess", "stdio", "both"], default="both")
+    parser.add_argument("--bank-sizes", default="builtin",
+                        help="comma-separated question counts, or 'builtin' for the bundled bank")
+    parser.add_argument("--counts", default="1,5,10", help="comma-separated question counts per call")
+    parser.add_argument("--topic-mixes", default="single,mixed", help=f"any of {','.join(TOPIC_MIXES)}")
+    parser.add_argument("--resource-types", default="videos,all", help="comma-separated resource types")
+    parser.add_argument("--requests", type=int, default=500, help="calls per scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent in-flight calls")
+    parser.add_argument("--cold-starts", type=int, default=3,
+                        help="server launches to time with and without a snapshot (stdio mode)")
+    args = parser.parse_args()
+    args.bank_sizes = [size.strip() for size in args.bank_sizes.split(",") if size.strip()]
+
+    scenarios = build_scenarios(
+        [int(count) for count in args.counts.split(",") if count.strip()],
+        [mix.strip() for mix in args.topic_mixes.split(",") if mix.strip()],
+        [rtype.strip() for rtype in args.resource_types.split(",") if rtype.strip()])
+
+    print_header()
+    if args.mode in ("stdio", "both"):
+        asyncio.run(bench_stdio(args, scenarios))
+    if args.mode in ("inprocess", "both"):
+        asyncio.run(bench_inprocess(args, scenarios))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Stand-in MCP client - open several concurrent sessions against an HTTP study server
+
+Start the server first, e.g.:
+    python study_server.py --transport streamable-http --port 8000
+then run:
+    python scripts/http_smoke_client.py --url http://127.0.0.1:8000/mcp --clients 20
+"""
+import sys
+import time
+import asyncio
+import argparse
+from mcp import ClientSession
+from mcp.client.sse import sse_client
+from mcp.client.streamable_http import streamablehttp_client
+
+TOPICS = ["math", "biology", "world history", "grammar", "python programming"]
+
+async def run_client(url, transport, client_id, calls):
+    """Open one session and call generate_study_questions `calls` times"""
+    if transport == "sse":
+        connection = sse_client(url)
+    else:
+        connection = streamablehttp_client(url)
+    async with connection as streams:
+        async with ClientSession(streams[0], streams[1]) as session:
+            await session.initialize()
+            for i in range(calls):
+                topic = TOPICS[(client_id + i) % len(TOPICS)]
+                result = await session.call_tool("generate_study_questions",
+                                                 {"topic": topic, "difficulty": "easy", "count": "3"})
+                text = result.content[0].text
+                if result.isError or not text.startswith("STUDY QUESTIONS"):
+                    raise RuntimeError(f"client {client_id}: unexpected response: {text[:80]!r}")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000/mcp", help="server endpoint (/mcp or /sse)")
+    parser.add_argument("--transport", choices=["streamable-http", "sse"], default="streamable-http")
+    parser.add_argument("--clients", type=int, default=10, help="concurrent sessions to open")
+    parser.add_argument("--calls", type=int, default=5, help="tool calls per session")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(run_client(args.url, args.transport, i, args.calls) for i in range(args.clients)),
+        return_exceptions=True)
+    elapsed = time.perf_counter() - start
+
+    failures = [r for r in results if isinstance(r, BaseException)]
+    for failure in failures:
+        print(f"FAILED: {failure!r}", file=sys.stderr)
+    total = args.clients * args.calls
+    print(f"{args.clients - len(failures)}/{args.clients} sessions OK, "
+          f"{total} calls in {elapsed:.2f}s ({total / elapsed:.1f} calls/s)")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Question import - stream CSV/JSONL question dumps into a SQLite question store
+
+Records are validated one by one, exact and near duplicates (MinHash/LSH) are
+dropped, and the rest are written to the SQLite file the server loads with
+STUDY_QUESTION_DB. Input is read in chunks, MinHash signatures are computed in
+a process pool, and the duplicate index lives in a temporary SQLite file, so
+memory stays flat however large the input is.
+
+Input formats (by file extension, or --format):
+  .jsonl  one object per line: subject, difficulty, question, choices (list),
+          correct_idx, explanation
+  .csv    header with subject, difficulty, question, choices ("|"-separated),
+          correct_idx, explanation
+
+correct_idx may be 0-based or a letter (A-D). Subjects may be any topic the
+server routes (e.g. "biology" goes to science).
+
+Usage:
+  python scripts/import_questions.py dump.jsonl more.csv --output questions.db
+  STUDY_QUESTION_DB=questions.db python study_server.py
+"""
+import os
+import re
+import csv
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+import argparse
+import tempfile
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import study_server  # noqa: E402
+
+DIFFICULTIES = ("easy", "medium", "hard")
+TRUE_FALSE = ("true", "false")
+NUM_PERMUTATIONS = 128
+SHINGLE_SIZE = 5
+SIGNATURE_BATCH = 16  # texts hashed together; larger batches fall out of the CPU cache
+LOOKUP_BATCH = 900  # keys per IN (...) query, below SQLite's variable limit
+BUCKET_CAP = 64  # most recent questions kept per LSH bucket; bounds work on templated input
+
+# Fixed seeds so every worker process computes comparable signatures
+_coefficients = np.random.default_rng(20240601).integers(0, 1 << 32, size=(2, NUM_PERMUTATIONS),
+                                                         dtype=np.uint32) | np.uint32(1)
+_band_weights = np.random.default_rng(7).integers(0, 1 << 63, size=NUM_PERMUTATIONS,
+                                                  dtype=np.uint64) | np.uint64(1)
+_shingle_weights = np.array([256 ** k for k in range(SHINGLE_SIZE)], dtype=np.uint64)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+class InvalidRecord(ValueError):
+    pass
+
+# === READING ===
+
+def read_records(path, file_format):
+    """Yield (line number, raw dict) from a CSV or JSONL file without loading it"""
+    with open(path, encoding="utf-8", newline="") as f:
+        if file_format == "csv":
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+            return
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield line_num, json.loads(line)
+            except ValueError as e:
+                yield line_num, InvalidRecord(f"invalid JSON: {e}")
+
+def parse_correct_idx(value):
+    if isinstance(value, str):
+        value = value.strip()
+        if len(value) == 1 and value.upper() in "ABCD":
+            return ord(value.upper()) - 65
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise InvalidRecord(f"correct_idx {value!r} is not a number or letter") from None
+
+def validate(record):
+    """Return (subject, difficulty, q_data) for a raw record, or raise InvalidRecord"""
+    if isinstance(record, InvalidRecord):
+        raise record
+    if not isinstance(record, dict):
+        raise InvalidRecord("record is not an object")
+    fields = ("subject", "difficulty", "question", "choices", "correct_idx", "explanation")
+    missing = [field for field in fields if record.get(field) in (None, "")]
+    if missing:
+        raise InvalidRecord(f"missing {', '.join(missing)}")
+
+    subject = study_server.subject_router.route(str(record["subject"]))
+    if subject is None:
+        raise InvalidRecord(f"unknown subject {record['subject']!r}")
+    difficulty = str(record["difficulty"]).strip().lower()
+    if difficulty not in DIFFICULTIES:
+        raise InvalidRecord(f"difficulty {record['difficulty']!r} is not easy, medium or hard")
+
+    choices = record["choices"]
+    if isinstance(choices, str):
+        choices = choices.split("|")
+    if not isinstance(choices, list):
+        raise InvalidRecord("choices is not a list")
+    choices = [str(choice).strip() for choice in choices]
+    question = str(record["question"]).strip()
+    is_true_false = question.lower().startswith("true or false") or {c.lower() for c in choices} <= set(TRUE_FALSE)
+    if is_true_false:
+        if sorted(c.lower() for c in choices) != sorted(TRUE_FALSE):
+            raise InvalidRecord("true/false questions need exactly the choices True and False")
+    elif not 2 <= len(choices) <= 4:
+        raise InvalidRecord(f"multiple choice questions need 2 to 4 choices, got {len(choices)}")
+    if "" in choices or len(set(choices)) != len(choices):
+        raise InvalidRecord("choices must be distinct and non-empty")
+
+    correct_idx = parse_correct_idx(record["correct_idx"])
+    if not 0 <= correct_idx < len(choices):
+        raise InvalidRecord(f"correct_idx {correct_idx} is out of range for {len(choices)} choices")
+    return subject, difficulty, (question, tuple(choices), correct_idx, str(record["explanation"]).strip())
+
+def validated_chunks(paths, file_format, chunk_size, rejections, max_reports):
+    """Yield lists of valid records, counting (and reporting a few) rejections"""
+    def records():
+        for path in paths:
+            fmt = file_format or ("csv" if path.lower().endswith(".csv") else "jsonl")
+            for line_num, record in read_records(path, fmt):
+                try:
+                    yield validate(record)
+                except InvalidRecord as e:
+                    reason = re.sub(r"\d+|'.*?'", "N", str(e))
+                    rejections[reason] += 1
+                    if sum(rejections.values()) <= max_reports:
+                        print(f"{path}:{line_num}: {e}", file=sys.stderr)
+    records = records()
+    while chunk := list(islice(records, chunk_size)):
+        yield chunk
+
+# === DUPLICATE DETECTION ===
+
+def normalize_text(*parts):
+    text = " ".join(parts).lower()
+    return re.sub(r"[^\w%]+", " ", text).strip().encode("utf-8")
+
+def minhash(texts):
+    """MinHash signatures of byte strings, one row per text.
+
+    Shingles are the byte windows of SHINGLE_SIZE, mixed down to 32-bit keys,
+    and every permutation is a random odd multiply plus add on those keys
+    (wrapping 32-bit arithmetic), applied to all shingles of a batch at once.
+    """
+    a, b = _coefficients
+    texts = [text.ljust(SHINGLE_SIZE) for text in texts]
+    buffer = np.frombuffer(b"".join(texts), dtype=np.uint8)
+    windows = np.lib.stride_tricks.sliding_window_view(buffer, SHINGLE_SIZE).astype(np.uint64)
+    keys = ((windows @ _shingle_weights) * _MIX >> np.uint64(32)).astype(np.uint32)
+    # Keep only windows that lie inside a single text
+    lengths = np.array([len(text) for text in texts])
+    counts = lengths - SHINGLE_SIZE + 1
+    window_starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    text_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    valid = np.repeat(text_starts - window_starts, counts) + np.arange(counts.sum())
+    hashed = np.multiply(keys[valid][:, None], a)
+    hashed += b
+    return np.minimum.reduceat(hashed, window_starts, axis=0)
+
+def signatures(chunk, bands):
+    """Exact-match key, MinHash signature and LSH band hashes of every record in a chunk (runs in a worker)"""
+    # Near duplicates ask the same question for the same answer; exact ones also share every choice
+    texts = [normalize_text(question, choices[correct_idx])
+             for _, _, (question, choices, correct_idx, _) in chunk]
+    rows = []
+    for start in range(0, len(texts), SIGNATURE_BATCH):
+        rows.append(minhash(texts[start:start + SIGNATURE_BATCH]))
+    signature_rows = np.concatenate(rows)
+    # Fold each band's values and its number into one bucket key, kept within SQLite's signed 64-bit range
+    band_rows = signature_rows.astype(np.uint64).reshape(len(texts), bands, -1)
+    band_hashes = (band_rows * _band_weights[:band_rows.shape[2]]).sum(axis=2)
+    band_hashes ^= np.arange(bands, dtype=np.uint64) * _MIX
+    band_hashes = (band_hashes >> np.uint64(1)).astype(np.int64)
+    results = []
+    for (_, _, (question, choices, _, _)), signature, hashes in zip(chunk, signature_rows, band_hashes.tolist()):
+        text = normalize_text(question, *sorted(choices))
+        # 64-bit BLAKE2b as a signed integer, SQLite's INTEGER range
+        exact = int.from_bytes(hashlib.blake2b(text, digest_size=8).digest(), "big", signed=True)
+        results.append((exact, signature, hashes))
+    return chunk, results
+
+class DuplicateIndex:
+    """Exact keys and LSH buckets of every kept question, stored in a temporary SQLite file.
+
+    Signatures are split into bands; two questions become candidates when any
+    band matches, and candidates count as duplicates when the share of equal
+    MinHash values (their estimated Jaccard similarity) reaches `threshold`.
+    Each chunk is checked against the file with batched key lookups, and
+    against its own earlier records in memory. Buckets keep only their
+    BUCKET_CAP most recent members, so templated input that lands thousands of
+    questions in one bucket still costs a bounded number of comparisons. The
+    file's page cache is capped at 64 MiB, so memory does not grow with the
+    number of questions kept.
+    """
+
+    def __init__(self, path, threshold):
+        self.threshold = threshold
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            PRAGMA temp_store = MEMORY;
+            PRAGMA cache_size = -65536;
+            CREATE TABLE exact (key INTEGER PRIMARY KEY);
+            CREATE TABLE signatures (id INTEGER PRIMARY KEY, signature BLOB NOT NULL);
+            CREATE TABLE buckets (key INTEGER, id INTEGER, PRIMARY KEY (key, id)) WITHOUT ROWID;
+        """)
+        self.next_id = 0
+
+    def similar(self, signature, others):
+        """True if any row of `others` is a near duplicate of `signature`"""
+        if not len(others):
+            return False
+        return np.count_nonzero(others == signature, axis=1).max() >= self.threshold * len(signature)
+
+    def lookup(self, sql, keys):
+        """Run `sql` (with an {} placeholder list) over the distinct `keys` in batches"""
+        keys = sorted(set(keys))
+        for start in range(0, len(keys), LOOKUP_BATCH):
+            batch = keys[start:start + LOOKUP_BATCH]
+            yield from self.conn.execute(sql.format(",".join("?" * len(batch))), batch)
+
+    def classify(self, results):
+        """Return 'exact', 'near' or None for each (exact key, signature, bucket keys) and store the kept ones"""
+        seen = {key for key, in self.lookup("SELECT key FROM exact WHERE key IN ({})",
+                                            (exact for exact, _, _ in results))}
+        members = {}
+        for key, question_id in sorted(self.lookup("SELECT key, id FROM buckets WHERE key IN ({})",
+                                                   (key for _, _, keys in results for key in keys))):
+            members.setdefault(key, []).append(question_id)
+        loaded = list(self.lookup("SELECT id, signature FROM signatures WHERE id IN ({})",
+                                  (question_id for ids in members.values() for question_id in ids)))
+        # One row per candidate signature: the loaded ones, then each record kept from this chunk
+        matrix = np.empty((len(loaded) + len(results), NUM_PERMUTATIONS), dtype=np.uint32)
+        rows = {}
+        for row, (question_id, blob) in enumerate(loaded):
+            matrix[row] = np.frombuffer(blob, dtype=np.uint32)
+            rows[question_id] = row
+
+        verdicts, kept_exact, kept_signatures, kept_buckets = [], [], [], []
+        for exact, signature, keys in results:
+            if exact in seen:
+                verdicts.append("exact")
+                continue
+            candidates = {rows[question_id] for key in keys for question_id in members.get(key, ())[-BUCKET_CAP:]}
+            if self.similar(signature, matrix[sorted(candidates)]):
+                verdicts.append("near")
+                continue
+            verdicts.append(None)
+            question_id = self.next_id
+            self.next_id += 1
+            # Later records of the same chunk are checked against this one in memory
+            seen.add(exact)
+            rows[question_id] = len(rows)
+            matrix[rows[question_id]] = signature
+            for key in keys:
+                members.setdefault(key, []).append(question_id)
+            kept_exact.append((exact,))
+            kept_signatures.append((question_id, signature.tobytes()))
+            kept_buckets.extend((key, question_id) for key in keys)
+        self.conn.executemany("INSERT INTO exact VALUES (?)", kept_exact)
+        self.conn.executemany("INSERT INTO signatures VALUES (?, ?)", kept_signatures)
+        self.conn.executemany("INSERT INTO buckets VALUES (?, ?)", kept_buckets)
+        # Drop all but the most recent BUCKET_CAP members of buckets that grew past it
+        self.conn.executemany("DELETE FROM buckets WHERE key = ? AND id < ?",
+                              [(key, ids[-BUCKET_CAP]) for key, ids in members.items() if len(ids) > BUCKET_CAP])
+        self.conn.commit()
+        return verdicts
+
+    def close(self):
+        self.conn.close()
+
+def signed_chunks(chunks, bands, workers):
+    """Compute signatures in a process pool, in input order, with a bounded number of chunks in flight"""
+    if workers <= 1:
+        yield from (signatures(chunk, bands) for chunk in chunks)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(signatures, chunk, bands))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def unique_records(chunks, index, bands, counts, workers):
+    """Yield records that are not duplicates of an earlier one"""
+    for chunk, results in signed_chunks(chunks, bands, workers):
+        for record, duplicate in zip(chunk, index.classify(results)):
+            if duplicate:
+                counts[f"{duplicate} duplicates"] += 1
+            else:
+                counts["written"] += 1
+                yield record
+
+def builtin_chunks(chunk_size):
+    """The server's current questions, so imports do not repeat them"""
+    records = study_server.knowledge.store.iter_questions()
+    while chunk := [(subject, difficulty, tuple(q_data)) for subject, difficulty, q_data in islice(records, chunk_size)]:
+        yield chunk
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="CSV or JSONL files to import")
+    parser.add_argument("--output", required=True, help="SQLite question file to write (replaced if it exists)")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="input format (default: by file extension)")
+    parser.add_argument("--include-builtin", action="store_true",
+                        help="start the store with the server's current questions")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="records per chunk")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="MinHash worker processes")
+    parser.add_argument("--bands", type=int, default=16, choices=[8, 16, 32, 64],
+                        help=f"LSH bands over the {NUM_PERMUTATIONS} MinHash values")
+    parser.add_argument("--threshold", type=float, default=0.8,
+                        help="estimated Jaccard similarity at which questions count as near duplicates")
+    parser.add_argument("--max-reports", type=int, default=20, help="invalid records to print")
+    args = parser.parse_args()
+
+    rejections, counts = Counter(), Counter()
+    chunks = validated_chunks(args.inputs, args.format, args.chunk_size, rejections, args.max_reports)
+    if args.include_builtin:
+        chunks = (chunk for source in (builtin_chunks(args.chunk_size), chunks) for chunk in source)
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp:
+        index = DuplicateIndex(os.path.join(tmp, "duplicates.db"), args.threshold)
+        try:
+            study_server.write_question_db(args.output, unique_records(chunks, index, args.bands, counts, args.workers))
+        finally:
+            index.close()
+    elapsed = time.perf_counter() - start
+
+    total = counts["written"] + counts["exact duplicates"] + counts["near duplicates"] + sum(rejections.values())
+    print(f"Read {total:,} records in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f}/s)")
+    print(f"  written:          {counts['written']:,}")
+    print(f"  exact duplicates: {counts['exact duplicates']:,}")
+    print(f"  near duplicates:  {counts['near duplicates']:,}")
+    print(f"  invalid:          {sum(rejections.values()):,}")
+    for reason, count in rejections.most_common():
+        print(f"    {count:>8,}  {reason}")
+    print(f"Serve it with: STUDY_QUESTION_DB={args.output} python study_server.py")
+
+if __name__ == "__main__":
+    main()
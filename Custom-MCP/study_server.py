@@ -2,11 +2,35 @@
 """
 Simple Study Helper MCP Server - Generate study questions and find learning resources
 """
+import time
+STARTUP_BEGIN = time.perf_counter()
+
+import os
+import re
 import sys
+import anyio
+import threading
+import argparse
+import functools
+import json
+import base64
+import hashlib
 import logging
+import importlib.util
+import math
+import atexit
+import bisect
+import itertools
+import heapq
+import pickle
 import random
+from array import array
+from collections import Counter, OrderedDict, namedtuple
+from functools import lru_cache
 from mcp.server.fastmcp import FastMCP
 
+startup_timings = {"imports": time.perf_counter() - STARTUP_BEGIN}
+
 # Configure logging to stderr
 logging.basicConfig(
     level=logging.INFO,
@@ -161,6 +185,12 @@ RESOURCES_DATABASE = {
             "Purplemath - Practical algebra help",
             "Wikipedia Math Portal - In-depth mathematical concepts",
         ],
+        "books": [
+            '"How to Solve It" by George Polya - Classic guide to problem solving',
+            '"Calculus Made Easy" by Silvanus P. Thompson - Gentle introduction to calculus',
+            '"The Art of Problem Solving" series - Challenging problems with full solutions',
+            'OpenStax Mathematics - Free peer-reviewed algebra, precalculus and calculus textbooks',
+        ],
         "tips": "Practice daily, show your work step-by-step, understand WHY formulas work (not just memorizing), draw diagrams for word problems, check answers by working backwards"
     },
     "science": {
@@ -182,6 +212,12 @@ RESOURCES_DATABASE = {
             "Biology Online - Life science articles",
             "Science Daily - Current science news and research",
         ],
+        "books": [
+            'OpenStax Science - Free peer-reviewed biology, chemistry and physics textbooks',
+            '"Campbell Biology" - Standard introductory biology textbook',
+            '"Conceptual Physics" by Paul G. Hewitt - Physics ideas with minimal math',
+            '"A Short History of Nearly Everything" by Bill Bryson - Readable tour of science',
+        ],
         "tips": "Connect concepts to real life, draw diagrams and label them, use mnemonic devices for memorization, do lab experiments if possible, explain concepts out loud to test understanding"
     },
     "history": {
@@ -203,6 +239,12 @@ RESOURCES_DATABASE = {
             "Britannica Online - Encyclopedia entries",
             "National Geographic History - Historical articles with photos",
         ],
+        "books": [
+            "\"A People's History of the United States\" by Howard Zinn - History from below",
+            '"Guns, Germs, and Steel" by Jared Diamond - Why societies developed differently',
+            '"The Penguin History of the World" by J.M. Roberts - One-volume world history',
+            'OpenStax U.S. History and World History - Free peer-reviewed textbooks',
+        ],
         "tips": "Create timelines to visualize chronology, connect events to their causes and effects, make flashcards for important dates, relate history to current events, use memory palaces for complex information"
     },
     "english": {
@@ -224,6 +266,12 @@ RESOURCES_DATABASE = {
             "SparkNotes - Literature guides and analysis",
             "Literary Devices - Explanations with examples",
         ],
+        "books": [
+            '"The Elements of Style" by Strunk and White - Concise writing rules',
+            '"How to Read a Book" by Mortimer Adler - Active, analytical reading',
+            '"On Writing Well" by William Zinsser - Clear nonfiction writing',
+            '"Eats, Shoots & Leaves" by Lynne Truss - Punctuation made memorable',
+        ],
         "tips": "Read daily for vocabulary and style, practice writing regularly, read your work aloud to catch errors, keep a vocabulary journal, analyze how authors structure their writing"
     },
     # ✨ NEW: Computer Science Resources
@@ -249,6 +297,12 @@ RESOURCES_DATABASE = {
             "Dev.to - Community articles on all CS topics",
             "Stack Overflow - Q&A for specific coding problems",
         ],
+        "books": [
+            '"Automate the Boring Stuff with Python" by Al Sweigart - Free beginner Python book',
+            '"Grokking Algorithms" by Aditya Bhargava - Illustrated algorithms guide',
+            '"Structure and Interpretation of Computer Programs" - Classic free programming text',
+            '"Introduction to Algorithms" (CLRS) - Comprehensive algorithms reference',
+        ],
         "tips": "Code every day (consistency over quantity), build projects to apply knowledge, read and understand others' code, debug systematically using print statements or debuggers, comment your code to explain your thinking, break problems into smaller pieces"
     },
     "general": {
@@ -270,205 +324,2177 @@ RESOURCES_DATABASE = {
             "BBC Bitesize - Educational content for all ages",
             "Britannica Online - Reliable encyclopedia",
         ],
+        "books": [
+            '"Make It Stick" by Brown, Roediger and McDaniel - The science of learning',
+            '"A Mind for Numbers" by Barbara Oakley - Learning techniques for any subject',
+            '"How to Study in College" by Walter Pauk - Note taking and study systems',
+            'OpenStax - Free peer-reviewed textbooks for many subjects',
+        ],
         "tips": "Space out study sessions (don't cram), teach concepts to others to reinforce learning, take breaks every 25-30 minutes, practice active recall instead of passive reading, get enough sleep for memory consolidation"
     }
 }
 
-# === UTILITY FUNCTIONS ===
+# === SUBJECT ROUTING ===
 
-def get_questions_for_subject(subject, difficulty, count):
-    """Get questions based on subject and difficulty"""
-    subject_lower = subject.lower()
-    
-    # Map subject to question database
-    if "math" in subject_lower or "algebra" in subject_lower or "geometry" in subject_lower or "calculus" in subject_lower:
-        question_bank = MATH_QUESTIONS
-    elif "science" in subject_lower or "biology" in subject_lower or "chemistry" in subject_lower or "physics" in subject_lower:
-        question_bank = SCIENCE_QUESTIONS
-    elif "history" in subject_lower or "social" in subject_lower:
-        question_bank = HISTORY_QUESTIONS
-    elif "english" in subject_lower or "grammar" in subject_lower or "writing" in subject_lower or "literature" in subject_lower:
-        question_bank = ENGLISH_QUESTIONS
-    # ✨ NEW: Computer Science topic detection
-    elif ("computer" in subject_lower or "programming" in subject_lower or "coding" in subject_lower or 
-          "cs" in subject_lower or "algorithm" in subject_lower or "data structure" in subject_lower or
-          "python" in subject_lower or "javascript" in subject_lower or "java" in subject_lower or
-          "software" in subject_lower or "web dev" in subject_lower):
-        question_bank = CS_QUESTIONS
-    else:
-        return None
-    
-    # Get questions for difficulty level
-    if difficulty in question_bank:
-        available_questions = question_bank[difficulty]
-        selected = random.sample(available_questions, min(count, len(available_questions)))
-        return selected
-    
-    return None
+# Declarative keyword table, in priority order (earlier subjects win ties).
+# Keywords match whole words; a trailing "*" also matches longer words that
+# start with the keyword (e.g. "math*" matches "maths" and "mathematics"), and
+# a leading "*" also matches at the end of a compound word (e.g. "*physics"
+# matches "astrophysics"). With both, the keyword may appear anywhere in a word.
+SUBJECT_KEYWORDS = {
+    "math": ["*math*", "*algebra*", "*geometr*", "*calculus", "*arithmetic", "trigonometry"],
+    "science": ["*science*", "scientific", "*biolog*", "*chemistry", "*chemical", "*physics"],
+    "history": ["*histor*", "social*"],
+    "english": ["english", "grammar*", "*writing", "*literature", "literary"],
+    "cs": ["computer*", "computer science", "programming", "coding", "cs", "algorithm*",
+           "data structure*", "python*", "javascript", "java", "software", "web dev*"],
+}
 
-def format_question(index, q_data, show_answer=True):
-    """Format a single question nicely"""
+QUESTION_BANKS = {
+    "math": MATH_QUESTIONS,
+    "science": SCIENCE_QUESTIONS,
+    "history": HISTORY_QUESTIONS,
+    "english": ENGLISH_QUESTIONS,
+    "cs": CS_QUESTIONS,
+}
+
+_NON_WORD = re.compile(r"[^a-z0-9+#]+")
+_END = "$"      # trie key: a keyword ends here and must end on a word boundary
+_PREFIX = "*"   # trie key: a keyword ends here and may continue into the word
+
+def normalize_topic(topic):
+    """Lowercase a topic and collapse punctuation/whitespace to single spaces"""
+    return _NON_WORD.sub(" ", topic.lower()).strip()
+
+class SubjectRouter:
+    """Matches every keyword in a topic in one pass over prebuilt character tries"""
+
+    def __init__(self, keyword_table):
+        self.priority = {subject: rank for rank, subject in enumerate(keyword_table)}
+        # Keywords are tried at the start of every word; those with a leading "*"
+        # are also tried at every later position inside a word
+        self.trie = {}
+        self.inner_trie = {}
+        for subject, keywords in keyword_table.items():
+            for keyword in keywords:
+                is_prefix = keyword.endswith("*")
+                for trie in (self.trie, self.inner_trie) if keyword.startswith("*") else (self.trie,):
+                    node = trie
+                    for char in normalize_topic(keyword.strip("*")):
+                        node = node.setdefault(char, {})
+                    node[_PREFIX if is_prefix else _END] = subject
+        # Cached on the normalized topic, so "Math", "math " and "MATH" share one entry
+        self.route_normalized = lru_cache(maxsize=1024)(self._route_normalized)
+
+    @staticmethod
+    def longest_match(trie, text, i):
+        """Return (end, subject) of the longest keyword in `trie` starting at text[i], or None"""
+        node = trie
+        best = None
+        j = i
+        length = len(text)
+        while j < length and text[j] in node:
+            node = node[text[j]]
+            j += 1
+            at_boundary = j == length or text[j] == " "
+            if _END in node and at_boundary:
+                best = (j, node[_END])
+            elif _PREFIX in node:
+                best = (j, node[_PREFIX])
+        return best
+
+    def matches(self, text):
+        """Return the subject of every non-overlapping keyword match in normalized text"""
+        found = []
+        length = len(text)
+        i = 0
+        while i < length:
+            if text[i] == " ":
+                i += 1
+                continue
+            word_start = i == 0 or text[i - 1] == " "
+            best = self.longest_match(self.trie if word_start else self.inner_trie, text, i)
+            if best:
+                found.append(best[1])
+                i = best[0]
+            else:
+                i += 1
+        return found
+
+    def route(self, topic):
+        """Return the subject key for a topic, or None if no keyword matches"""
+        return self.route_normalized(normalize_topic(topic))
+
+    def _route_normalized(self, topic):
+        matched = self.matches(topic)
+        if not matched:
+            return None
+        counts = Counter(matched)
+        return min(counts, key=lambda subject: (-counts[subject], self.priority[subject]))
+
+subject_router = SubjectRouter(SUBJECT_KEYWORDS)
+
+# === QUESTION RENDERING ===
+
+def render_choice_lines(choices):
+    """Render the lettered choice lines of a question"""
+    return "".join(f"{chr(65 + i)}) {choice}\n" for i, choice in enumerate(choices))
+
+def render_answer(choices, correct_idx, explanation):
+    return (f"\nAnswer: {chr(65 + correct_idx)}) {choices[correct_idx]}\n"
+            f"Explanation: {explanation}\n")
+
+def render_question_fragments(q_data):
+    """Render the static parts of a question: (question + choices, answer + explanation)"""
     question, choices, correct_idx, explanation = q_data
+    return f"{question}\n{render_choice_lines(choices)}", render_answer(choices, correct_idx, explanation)
+
+def question_fragments(q_data):
+    """Return (body, answer) fragments, using pooled choice lines for table rows"""
+    if isinstance(q_data, QuestionRow):
+        return q_data.body, q_data.answer
+    return render_question_fragments(q_data)
+
+# === COMPACT QUESTION TABLE ===
+
+class QuestionRow:
+    """Lightweight view of one row in a QuestionTable.
+
+    Unpacks like the (question, choices, correct_idx, explanation) tuples used by
+    the question dicts, so it can be passed anywhere a question tuple is expected.
+    """
+    __slots__ = ("table", "index")
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    @property
+    def question(self):
+        return self.table.string(self.table.question_ids[self.index])
+
+    @property
+    def choices(self):
+        table = self.table
+        start, stop = table.choice_offsets[self.index], table.choice_offsets[self.index + 1]
+        return tuple(table.string(sid) for sid in table.choice_ids[start:stop])
+
+    @property
+    def correct_idx(self):
+        return self.table.correct_indices[self.index]
+
+    @property
+    def explanation(self):
+        return self.table.string(self.table.explanation_ids[self.index])
+
+    @property
+    def body(self):
+        table = self.table
+        return f"{self.question}\n{table.string(table.choice_line_ids[self.index])}"
+
+    @property
+    def answer(self):
+        table = self.table
+        start = table.choice_offsets[self.index]
+        correct_idx = table.correct_indices[self.index]
+        choice = table.string(table.choice_ids[start + correct_idx])
+        return f"\nAnswer: {chr(65 + correct_idx)}) {choice}\nExplanation: {self.explanation}\n"
+
+    def __iter__(self):
+        return iter((self.question, self.choices, self.correct_idx, self.explanation))
+
+    def __len__(self):
+        return 4
+
+    def __getitem__(self, i):
+        return tuple(self)[i]
+
+    def __repr__(self):
+        return f"QuestionRow({self.index}, {self.question!r})"
+
+class QuestionTable:
+    """Column-oriented question storage.
+
+    All text lives in one UTF-8 string pool addressed by offset, and each question
+    is a handful of integers in parallel arrays instead of a tuple plus a list
+    plus four str objects. Choice strings are interned while the table is built,
+    so answers like "True"/"False" are stored once for the whole bank. The
+    rendered choice lines are interned too (banks share many choice sets), so
+    serving a question joins a few pooled strings instead of re-formatting
+    every choice, without storing each question's text a second time.
+    """
+
+    def __init__(self):
+        self._pool = bytearray()
+        self._offsets = array("I", [0])
+        self._interned = {}
+        self.question_ids = array("I")
+        self.explanation_ids = array("I")
+        self.choice_line_ids = array("I")
+        self.correct_indices = array("B")
+        self.choice_offsets = array("I", [0])
+        self.choice_ids = array("I")
+        self.banks = {}
+
+    STATE_ARRAYS = ("question_ids", "explanation_ids", "choice_line_ids", "correct_indices", "choice_offsets", "choice_ids")
+
+    def __len__(self):
+        return len(self.question_ids)
+
+    def _add_string(self, text):
+        self._pool += text.encode("utf-8")
+        self._offsets.append(len(self._pool))
+        return len(self._offsets) - 2
+
+    def _intern(self, text):
+        sid = self._interned.get(text)
+        if sid is None:
+            sid = self._interned[text] = self._add_string(text)
+        return sid
+
+    def append(self, q_data):
+        """Add one (question, choices, correct_idx, explanation) record"""
+        question, choices, correct_idx, explanation = q_data
+        self.question_ids.append(self._add_string(question))
+        self.explanation_ids.append(self._add_string(explanation))
+        self.correct_indices.append(correct_idx)
+        self.choice_ids.extend(self._intern(choice) for choice in choices)
+        self.choice_offsets.append(len(self.choice_ids))
+        self.choice_line_ids.append(self._intern(render_choice_lines(choices)))
+
+    def add_bank(self, subject, difficulty, questions):
+        """Append a bank of questions and record its row range"""
+        start = len(self)
+        for q_data in questions:
+            self.append(q_data)
+        self.banks[(subject, difficulty)] = range(start, len(self))
+
+    def freeze(self):
+        """Finish building: drop the intern map and make the string pool immutable"""
+        self._pool = memoryview(bytes(self._pool))
+        self._interned = {}
+        return self
+
+    def to_state(self):
+        """Plain arrays, bytes and dicts for a snapshot; see from_state"""
+        state = {name: getattr(self, name) for name in self.STATE_ARRAYS}
+        state["pool"] = bytes(self._pool)
+        state["offsets"] = self._offsets
+        state["banks"] = {key: (rows.start, rows.stop) for key, rows in self.banks.items()}
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild a frozen table from to_state() output"""
+        table = cls()
+        for name in cls.STATE_ARRAYS:
+            setattr(table, name, state[name])
+        table._pool = memoryview(state["pool"])
+        table._offsets = state["offsets"]
+        table.banks = {key: range(start, stop) for key, (start, stop) in state["banks"].items()}
+        return table
+
+    def string(self, sid):
+        return str(self._pool[self._offsets[sid]:self._offsets[sid + 1]], "utf-8")
+
+    def row(self, index):
+        return QuestionRow(self, index)
+
+    @classmethod
+    def from_banks(cls, banks):
+        """Build a frozen table from {subject: {difficulty: [question tuples]}}"""
+        table = cls()
+        for subject, bank in banks.items():
+            for difficulty, questions in bank.items():
+                table.add_bank(subject, difficulty, questions)
+        return table.freeze()
+
+# === QUESTION STORES ===
+
+def content_question_id(q_data):
+    """Stable ID derived from a question's text, choices and answer.
+
+    It does not depend on where the question sits in its bank, so IDs handed out
+    in a quiz stay valid when the bank is reordered or reloaded.
+    """
+    question, choices, correct_idx, _ = q_data
+    key = "\x1f".join((question, *choices, str(correct_idx)))
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=6).hexdigest()
+
+class InMemoryQuestionStore:
+    """Default backend: samples from a QuestionTable built from the question dicts"""
+
+    def __init__(self, table):
+        self.table = table
+
+    def bank_size(self, subject, difficulty):
+        return len(self.table.banks.get((subject, difficulty), range(0)))
+
+    def question_id(self, subject, difficulty, position, q_data):
+        return content_question_id(q_data)
+
+    def fetch(self, subject, difficulty, positions):
+        """Return the questions at the given positions (0..bank_size-1) of a bank"""
+        rows = self.table.banks[(subject, difficulty)]
+        return [self.table.row(rows[position]) for position in positions]
+
+    def iter_question_texts(self, subject, difficulty):
+        """Yield the question text of every question in a bank"""
+        table = self.table
+        for i in table.banks.get((subject, difficulty), ()):
+            yield table.string(table.question_ids[i])
+
+    def sample_positions(self, subject, difficulty, count, rng=random):
+        """Return up to `count` distinct random positions in a bank"""
+        size = self.bank_size(subject, difficulty)
+        return rng.sample(range(size), min(count, size))
+
+    def sample(self, subject, difficulty, count, rng=random):
+        """Return up to `count` random questions, or an empty list if there are none"""
+        return self.fetch(subject, difficulty, self.sample_positions(subject, difficulty, count, rng))
+
+    def iter_questions(self):
+        """Yield (subject, difficulty, question) for every stored question"""
+        for (subject, difficulty), rows in self.table.banks.items():
+            for i in rows:
+                yield subject, difficulty, self.table.row(i)
+
+    def close(self):
+        pass
+
+class SQLiteQuestionStore:
+    """Read-only backend over a SQLite question file.
+
+    Each (subject, difficulty) bank numbers its rows 0..n-1 in `seq`, so a sample
+    is drawn as k random seq values and fetched through the (subject, difficulty, seq)
+    index without scanning or loading the rest of the bank.
+    """
+
+    def __init__(self, path):
+        import sqlite3  # deferred: only needed when a SQLite store is configured
+        self.path = path
+        self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        # Tool calls run on worker threads and share this connection
+        self.lock = threading.Lock()
+        self.sizes = {
+            (subject, difficulty): size
+            for subject, difficulty, size in self.conn.execute(
+                "SELECT subject, difficulty, size FROM bank_sizes")
+        }
+        # Files from write_question_db carry a question ID column and a full-text
+        # index, so search and grading query the file instead of loading it
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(questions)")}
+        has_fts = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'questions_fts'").fetchone() is not None
+        self.indexed = "qid" in columns and has_fts
+
+    def bank_size(self, subject, difficulty):
+        return self.sizes.get((subject, difficulty), 0)
+
+    def search(self, query, k=5):
+        """Return up to k (score, ref) pairs from the file's full-text index, best first"""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT q.subject, q.difficulty, q.seq, f.score FROM ("
+                "  SELECT rowid, bm25(questions_fts) AS score FROM questions_fts"
+                "  WHERE questions_fts MATCH ? ORDER BY score LIMIT ?"
+                ") f JOIN questions q ON q.rowid = f.rowid ORDER BY f.score",
+                (" OR ".join(f'"{term}"' for term in terms), k)).fetchall()
+        # FTS5 reports BM25 as a negative number, lower is better
+        return [(-score, ("question", subject, difficulty, seq)) for subject, difficulty, seq, score in rows]
+
+    def answer_key(self, question_id):
+        """Return (subject, difficulty, position, correct_idx) for a question ID, or None"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT subject, difficulty, seq, correct_idx FROM questions WHERE qid = ? LIMIT 1",
+                (question_id,)).fetchone()
+
+    def question_id(self, subject, difficulty, position, q_data):
+        return content_question_id(q_data)
+
+    def fetch(self, subject, difficulty, seqs):
+        """Return the questions at the given seq positions of a bank"""
+        if not seqs:
+            return []
+        placeholders = ",".join("?" * len(seqs))
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT seq, question, choices, correct_idx, explanation FROM questions "
+                f"WHERE subject = ? AND difficulty = ? AND seq IN ({placeholders})",
+                (subject, difficulty, *seqs),
+            ).fetchall()
+        by_seq = {seq: (question, json.loads(choices), correct_idx, explanation)
+                  for seq, question, choices, correct_idx, explanation in rows}
+        return [by_seq[seq] for seq in seqs]
+
+    def iter_question_texts(self, subject, difficulty):
+        """Yield the question text of every question in a bank, streamed from the file"""
+        with self.lock:
+            for question, in self.conn.execute(
+                    "SELECT question FROM questions WHERE subject = ? AND difficulty = ?", (subject, difficulty)):
+                yield question
+
+    def sample_positions(self, subject, difficulty, count, rng=random):
+        """Return up to `count` distinct random positions in a bank"""
+        size = self.bank_size(subject, difficulty)
+        return rng.sample(range(size), min(count, size))
+
+    def sample(self, subject, difficulty, count, rng=random):
+        """Return up to `count` random questions, or an empty list if there are none"""
+        return self.fetch(subject, difficulty, self.sample_positions(subject, difficulty, count, rng))
+
+    def iter_questions(self):
+        """Yield (subject, difficulty, question) for every stored question"""
+        rows = self.conn.execute(
+            "SELECT subject, difficulty, question, choices, correct_idx, explanation "
+            "FROM questions ORDER BY subject, difficulty, seq")
+        for subject, difficulty, question, choices, correct_idx, explanation in rows:
+            yield subject, difficulty, (question, json.loads(choices), correct_idx, explanation)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def write_question_db(path, questions):
+    """Write (subject, difficulty, question) records to a new SQLite question file.
+
+    The file is built next to `path` and moved into place only once complete, so
+    a server reading `path` never sees a half-written file.
+    """
+    import sqlite3
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript("""
+            CREATE TABLE questions (
+                subject TEXT NOT NULL,
+                difficulty TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                question TEXT NOT NULL,
+                choices TEXT NOT NULL,
+                correct_idx INTEGER NOT NULL,
+                explanation TEXT NOT NULL,
+                qid TEXT NOT NULL
+            );
+            CREATE TABLE bank_sizes (
+                subject TEXT NOT NULL,
+                difficulty TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                PRIMARY KEY (subject, difficulty)
+            );
+        """)
+        sizes = Counter()
+
+        def rows():
+            for subject, difficulty, q_data in questions:
+                question, choices, correct_idx, explanation = q_data
+                seq = sizes[(subject, difficulty)]
+                sizes[(subject, difficulty)] += 1
+                yield (subject, difficulty, seq, question, json.dumps(list(choices)),
+                       correct_idx, explanation, content_question_id(q_data))
+
+        conn.executemany("INSERT INTO questions VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows())
+        conn.executemany("INSERT INTO bank_sizes VALUES (?, ?, ?)",
+                         [(subject, difficulty, size) for (subject, difficulty), size in sizes.items()])
+        # Build the index after the bulk insert, which is much faster than maintaining it row by row
+        conn.execute("CREATE UNIQUE INDEX idx_questions_bank ON questions (subject, difficulty, seq)")
+        conn.execute("CREATE INDEX idx_questions_qid ON questions (qid)")
+        # Contentless full-text index over the same text search_study_material ranks
+        conn.execute("CREATE VIRTUAL TABLE questions_fts USING fts5(text, content='')")
+        conn.execute("INSERT INTO questions_fts (rowid, text) "
+                     "SELECT rowid, question || ' ' || choices || ' ' || explanation FROM questions")
+        conn.commit()
+    except BaseException:
+        conn.close()
+        os.remove(tmp_path)
+        raise
+    conn.close()
+    os.replace(tmp_path, path)
+
+# === PARAMETRIC MATH ===
+
+_numpy = None
+
+@lru_cache(maxsize=None)
+def has_numpy():
+    return importlib.util.find_spec("numpy") is not None
+
+def load_numpy():
+    """Import NumPy on first use so it stays off the startup path"""
+    global _numpy
+    if _numpy is None:
+        import numpy
+        _numpy = numpy
+    return _numpy
+
+def splitmix64(np, x):
+    """Vectorized splitmix64: a well-mixed uint64 hash of each element of x"""
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+# Each template enumerates its whole parameter space. `ranges` gives the (lo, hi)
+# bounds of each operand and build(np, *operands) takes one int64 array per
+# operand, returning (question texts, answers, explanations, answer-check mask,
+# negative choices allowed). The check recomputes the answer from the numbers
+# shown in the question.
+MathTemplate = namedtuple("MathTemplate", ["ranges", "build"])
+
+def template_size(template):
+    return math.prod(hi - lo + 1 for lo, hi in template.ranges)
+
+def decode_operands(template, local):
+    """Split indices in 0..template_size-1 into one operand array per range (mixed radix)"""
+    operands = []
+    for lo, hi in reversed(template.ranges):
+        local, digit = divmod(local, hi - lo + 1)
+        operands.append(lo + digit)
+    return operands[::-1]
+
+def _build_addition(np, a, b):
+    answers = a + b
+    texts = [f"What is {x} + {y}?" for x, y in zip(a.tolist(), b.tolist())]
+    explanations = [f"Add the two numbers: {x} + {y} = {z}"
+                    for x, y, z in zip(a.tolist(), b.tolist(), answers.tolist())]
+    return texts, answers, explanations, answers - b == a, False
+
+def _build_subtraction(np, b, answers):
+    a = b + answers
+    texts = [f"What is {x} - {y}?" for x, y in zip(a.tolist(), b.tolist())]
+    explanations = [f"Subtract: {x} - {y} = {z}"
+                    for x, y, z in zip(a.tolist(), b.tolist(), answers.tolist())]
+    return texts, answers, explanations, a - b == answers, False
+
+def _multiplication(lo_a, hi_a, lo_b, hi_b):
+    def build(np, a, b):
+        answers = a * b
+        texts = [f"What is {x} x {y}?" for x, y in zip(a.tolist(), b.tolist())]
+        explanations = [f"Multiply: {x} x {y} = {z}"
+                        for x, y, z in zip(a.tolist(), b.tolist(), answers.tolist())]
+        return texts, answers, explanations, (answers % a == 0) & (answers // a == b), False
+    return MathTemplate(((lo_a, hi_a), (lo_b, hi_b)), build)
+
+def _build_division(np, answers, b):
+    dividends = answers * b
+    texts = [f"What is {d} / {y}?" for d, y in zip(dividends.tolist(), b.tolist())]
+    explanations = [f"Divide: {d} / {y} = {z} (check: {z} x {y} = {d})"
+                    for d, y, z in zip(dividends.tolist(), b.tolist(), answers.tolist())]
+    return texts, answers, explanations, (dividends % b == 0) & (dividends // b == answers), False
+
+def _percentage(pct_step, pct_units, base_unit, base_units):
+    # pct * base is always a multiple of 100 because pct_step * base_unit is
+    def build(np, pct, base):
+        pct, base = pct * pct_step, base * base_unit
+        answers = pct * base // 100
+        texts = [f"What is {p}% of {b}?" for p, b in zip(pct.tolist(), base.tolist())]
+        explanations = [f"{p}% of {b} = {p}/100 x {b} = {z}"
+                        for p, b, z in zip(pct.tolist(), base.tolist(), answers.tolist())]
+        return texts, answers, explanations, answers * 100 == pct * base, False
+    return MathTemplate(((1, pct_units), (1, base_units)), build)
+
+def _linear(hi_a, lo_x, hi_x, hi_b, negative_b):
+    def build(np, a, answers, b, negate=None):
+        if negate is not None:
+            b = np.where(negate == 1, -b, b)
+        c = a * answers + b
+        texts, explanations = [], []
+        for x_coef, x, const, total in zip(a.tolist(), answers.tolist(), b.tolist(), c.tolist()):
+            sign = "+" if const > 0 else "-"
+            step = f"subtract {const}" if const > 0 else f"add {-const}"
+            texts.append(f"Solve: {x_coef}x {sign} {abs(const)} = {total}. What is x?")
+            explanations.append(f"{x_coef}x {sign} {abs(const)} = {total}, {step}: "
+                                f"{x_coef}x = {total - const}, divide by {x_coef}: x = {x}")
+        return texts, answers, explanations, ((c - b) % a == 0) & ((c - b) // a == answers), negative_b
+    ranges = ((2, hi_a), (lo_x, hi_x), (1, hi_b)) + (((0, 1),) if negative_b else ())
+    return MathTemplate(ranges, build)
+
+def _build_square(np, n):
+    answers = n * n
+    texts = [f"What is {x}² ({x} squared)?" for x in n.tolist()]
+    explanations = [f"{x}² = {x} x {x} = {z}" for x, z in zip(n.tolist(), answers.tolist())]
+    return texts, answers, explanations, (answers % n == 0) & (answers // n == n), False
+
+MATH_TEMPLATES = {
+    "easy": [MathTemplate(((1, 99), (1, 99)), _build_addition),
+             MathTemplate(((1, 99), (1, 100)), _build_subtraction),
+             _multiplication(2, 15, 2, 15),
+             MathTemplate(((2, 15), (2, 12)), _build_division)],
+    "medium": [_multiplication(11, 99, 2, 29), _percentage(5, 19, 20, 100), _linear(12, 1, 30, 50, False)],
+    "hard": [_linear(15, -20, 20, 50, True), _percentage(1, 99, 100, 20), MathTemplate(((11, 30),), _build_square)],
+}
+
+class ParametricMathBank:
+    """Procedurally generated math questions addressed by index.
+
+    Each difficulty's index space is the combined parameter space of its
+    templates, so every index is a different question. Index i is mapped onto
+    that space by a fixed stride coprime to its size, which spreads consecutive
+    indices across all templates, and a whole batch of indices is generated with
+    array operations: operands, answers, three distinct distractors and the
+    correct letter. Every answer is re-checked against the operands shown in the
+    question before it is returned.
+    """
+
+    DISTRACTOR_OFFSETS = 10
+    STRIDE = 0x9E3779B1
+
+    def __init__(self, limit=None, seed=0):
+        """`limit` caps how many questions each difficulty offers (default: all of them)"""
+        self.seed = seed
+        self.layouts = {}
+        for difficulty, templates in MATH_TEMPLATES.items():
+            starts = [0]
+            for template in templates:
+                starts.append(starts[-1] + template_size(template))
+            space = starts.pop()
+            stride = self.STRIDE % space or 1
+            while math.gcd(stride, space) != 1:
+                stride += 1
+            self.layouts[difficulty] = (starts, space, stride)
+        self.limit = limit
+
+    def space(self, difficulty):
+        """Number of distinct questions the difficulty's templates can produce"""
+        return self.layouts[difficulty][1]
+
+    def size(self, difficulty):
+        return self.space(difficulty) if self.limit is None else min(self.limit, self.space(difficulty))
+
+    def generate(self, difficulty, indices, texts_only=False):
+        """Return (question, choices, correct_idx, explanation) tuples for the given indices.
+
+        With texts_only, return just the question texts and skip building the choices.
+        """
+        np = load_numpy()
+        templates = MATH_TEMPLATES[difficulty]
+        starts, space, stride = self.layouts[difficulty]
+        points = (np.asarray(indices, dtype=np.int64) * stride + self.seed) % space
+        picks = np.searchsorted(np.asarray(starts), points, side="right") - 1
+        salt = (list(MATH_TEMPLATES).index(difficulty) + 1) << 56 ^ self.seed
+        keys = points.astype(np.uint64) * np.uint64(64) + np.uint64(salt)
+        results = [None] * len(points)
+        for t, template in enumerate(templates):
+            rows = np.nonzero(picks == t)[0]
+            if not rows.size:
+                continue
+            row_keys = keys[rows]
+
+            def draw(stream, lo, hi, row_keys=row_keys):
+                h = (splitmix64(np, row_keys + np.uint64(stream)) >> np.uint64(1)).astype(np.int64)
+                return lo + h % (np.asarray(hi, dtype=np.int64) - lo + 1)
+
+            operands = decode_operands(template, points[rows] - starts[t])
+            texts, answers, explanations, valid, allow_negative = template.build(np, *operands)
+            if not valid.all():
+                raise RuntimeError(f"{template.build.__name__} produced an incorrect answer")
+            if texts_only:
+                for row, text in zip(rows.tolist(), texts):
+                    results[row] = text
+                continue
+            choices, correct = self._choices(np, draw, answers, allow_negative)
+            for row, text, row_choices, correct_idx, explanation in zip(
+                    rows.tolist(), texts, choices.tolist(), correct.tolist(), explanations):
+                results[row] = (text, [str(choice) for choice in row_choices], correct_idx, explanation)
+        return results
+
+    def _choices(self, np, draw, answers, allow_negative):
+        """Build an (n, 4) array of choices with the answer at a random column"""
+        n = len(answers)
+        # Three distinct offset magnitudes per row: rank random keys, keep the top three
+        ranks = np.stack([draw(10 + k, 0, 2**62) for k in range(self.DISTRACTOR_OFFSETS)], axis=1)
+        magnitudes = np.argsort(ranks, axis=1)[:, :3] + 1
+        magnitudes *= np.where(np.abs(answers) >= 100, 10, 1)[:, None]
+        negative = np.stack([draw(30 + k, 0, 1) for k in range(3)], axis=1) == 1
+        if not allow_negative:
+            negative &= answers[:, None] - magnitudes >= 0
+        distractors = answers[:, None] + np.where(negative, -magnitudes, magnitudes)
+        correct = draw(40, 0, 3)
+        is_answer = np.arange(4) == correct[:, None]
+        choices = np.empty((n, 4), dtype=np.int64)
+        choices[is_answer] = answers
+        choices[~is_answer] = distractors.ravel()
+        return choices, correct
+
+def find_generated_duplicates(store, generators):
+    """Map (subject, difficulty) to the sorted generator indices whose question text is already stored.
+
+    Generates each bank's whole parameter space once and streams the stored
+    texts past it, so memory depends on the templates, not on the store size.
+    Runs while knowledge is built (at startup or on the reload thread), and the
+    result is kept in snapshots.
+    """
+    duplicates = {}
+    for subject, generator in generators.items():
+        for difficulty in MATH_TEMPLATES:
+            if not store.bank_size(subject, difficulty):
+                continue
+            texts = generator.generate(difficulty, range(generator.space(difficulty)), texts_only=True)
+            index = {text: i for i, text in enumerate(texts)}
+            found = {index[text] for text in store.iter_question_texts(subject, difficulty) if text in index}
+            if found:
+                duplicates[(subject, difficulty)] = sorted(found)
+    return duplicates
+
+class AugmentedQuestionStore:
+    """Extends a store's banks with generated questions placed after the stored ones.
+
+    Random samples mix stored and generated questions, so math sets stay varied
+    while large sets never run dry; sessions draw every stored question first.
+    Generated questions whose text is already in the stored bank (`duplicates`,
+    from find_generated_duplicates) are skipped, so a set never shows the same
+    question twice.
+    """
+
+    # Chance that each slot of a random sample is filled from the stored questions
+    STORED_SHARE = 0.5
+
+    def __init__(self, base, generators, duplicates):
+        self.base = base
+        self.generators = generators
+        self.duplicates = duplicates
+        # Sorted `index - rank` of each skipped generator index:
+        # generated position p is generator index p + bisect_right(skips, p)
+        self._skips = {}
+        for (subject, difficulty), indices in duplicates.items():
+            size = generators[subject].size(difficulty)
+            self._skips[(subject, difficulty)] = [
+                index - rank for rank, index in enumerate(i for i in indices if i < size)]
+
+    def _skips_for(self, subject, difficulty):
+        return self._skips.get((subject, difficulty), [])
+
+    def _generated_size(self, subject, difficulty):
+        generator = self.generators.get(subject)
+        if generator is None or difficulty not in MATH_TEMPLATES:
+            return 0
+        return generator.size(difficulty) - len(self._skips_for(subject, difficulty))
+
+    def _generator_indices(self, subject, difficulty, generated_positions):
+        skips = self._skips_for(subject, difficulty)
+        return [p + bisect.bisect_right(skips, p) for p in generated_positions]
+
+    def bank_size(self, subject, difficulty):
+        return self.base.bank_size(subject, difficulty) + self._generated_size(subject, difficulty)
+
+    def stored_size(self, subject, difficulty):
+        return self.base.bank_size(subject, difficulty)
+
+    def question_id(self, subject, difficulty, position, q_data):
+        """Generated questions are identified by their generator index, which regenerates them exactly"""
+        base_size = self.base.bank_size(subject, difficulty)
+        if position < base_size:
+            return self.base.question_id(subject, difficulty, position, q_data)
+        index, = self._generator_indices(subject, difficulty, [position - base_size])
+        return f"gen-{subject}-{difficulty}-{index}"
+
+    def generated_question(self, question_id):
+        """Rebuild a generated question from its ID, or return None if it is not one"""
+        try:
+            prefix, subject, difficulty, index = question_id.split("-")
+            index = int(index)
+        except ValueError:
+            return None
+        generator = self.generators.get(subject)
+        if (prefix != "gen" or generator is None or difficulty not in MATH_TEMPLATES
+                or not 0 <= index < generator.size(difficulty)):
+            return None
+        return generator.generate(difficulty, [index])[0]
+
+    def fetch(self, subject, difficulty, positions):
+        base_size = self.base.bank_size(subject, difficulty)
+        stored = [p for p in positions if p < base_size]
+        generated = [p - base_size for p in positions if p >= base_size]
+        stored_questions = iter(self.base.fetch(subject, difficulty, stored))
+        generated_questions = iter(self.generators[subject].generate(
+            difficulty, self._generator_indices(subject, difficulty, generated)) if generated else [])
+        return [next(stored_questions) if p < base_size else next(generated_questions) for p in positions]
+
+    def sample_positions(self, subject, difficulty, count, rng=random):
+        """Random positions across stored and generated questions.
+
+        Each slot goes to a stored question with probability STORED_SHARE (when
+        there are generated ones to mix in), so sets keep the written questions in
+        the mix without reusing the same few on every call.
+        """
+        base_size = self.base.bank_size(subject, difficulty)
+        generated_size = self._generated_size(subject, difficulty)
+        count = min(count, base_size + generated_size)
+        stored = sum(rng.random() < self.STORED_SHARE for _ in range(count)) if generated_size else count
+        stored = max(min(stored, base_size), count - generated_size)
+        positions = rng.sample(range(base_size), stored)
+        positions += [base_size + p for p in rng.sample(range(generated_size), count - stored)]
+        rng.shuffle(positions)
+        return positions
+
+    def sample(self, subject, difficulty, count, rng=random):
+        return self.fetch(subject, difficulty, self.sample_positions(subject, difficulty, count, rng))
+
+    def iter_questions(self):
+        """Yield the stored questions only; generated ones are not indexed or exported"""
+        return self.base.iter_questions()
+
+    def close(self):
+        self.base.close()
+
+def augment_store(store, duplicates=None):
+    """Add generated math questions (at most STUDY_GENERATED_MATH per difficulty, 0 disables) when NumPy is installed.
+
+    `duplicates` is find_generated_duplicates() output saved in a snapshot; it is
+    computed here when not given.
+    """
+    size = int(os.environ.get("STUDY_GENERATED_MATH", "100000"))
+    if size <= 0:
+        return store
+    if not has_numpy():
+        logger.warning("NumPy is not installed; generated math questions are disabled")
+        return store
+    generators = {"math": ParametricMathBank(size)}
+    if duplicates is None:
+        duplicates = find_generated_duplicates(store, generators)
+    return AugmentedQuestionStore(store, generators, duplicates)
+
+# === SESSION SAMPLING ===
+
+class LazyPermutation:
+    """Random permutation of range(size) generated one element at a time.
+
+    Runs Fisher-Yates incrementally, recording only the swapped slots, so drawing
+    k items costs O(k) time and memory no matter how large the bank is. Once every
+    position has been drawn the permutation reshuffles and starts a new pass.
+    """
+
+    def __init__(self, size, rng):
+        self.size = size
+        self.rng = rng
+        self.drawn = 0
+        self.swaps = {}
+
+    def draw(self, count):
+        """Return up to `count` positions, none repeated until the bank is exhausted"""
+        positions = []
+        for _ in range(min(count, self.size)):
+            if self.drawn == self.size:
+                self.drawn = 0
+                self.swaps = {}
+            i = self.drawn
+            j = self.rng.randrange(i, self.size)
+            positions.append(self.swaps.get(j, j))
+            self.swaps[j] = self.swaps.pop(i, i)
+            self.drawn += 1
+        return positions
+
+class TieredPermutation:
+    """Session order over a bank split into tiers (stored questions, then generated ones).
+
+    Every position of a tier is drawn, in random order, before the next tier
+    starts; after the last tier the order starts again from the first. Nothing
+    repeats until the whole bank has been drawn.
+    """
+
+    def __init__(self, sizes, rng):
+        self.sizes = tuple(sizes)
+        self.size = sum(self.sizes)
+        self.offsets = list(itertools.accumulate(self.sizes, initial=0))
+        self.tiers = [LazyPermutation(size, rng) for size in self.sizes]
+        self.current = 0
+
+    def draw(self, count):
+        positions = []
+        count = min(count, self.size)
+        while len(positions) < count:
+            tier = self.tiers[self.current]
+            if tier.drawn == tier.size:
+                tier.drawn, tier.swaps = 0, {}
+            take = min(count - len(positions), tier.size - tier.drawn)
+            positions += [self.offsets[self.current] + p for p in tier.draw(take)]
+            if tier.drawn == tier.size:
+                self.current = (self.current + 1) % len(self.tiers)
+        return positions
+
+class SessionSampler:
+    """No-repeat sampling per (session, bank, difficulty), with LRU eviction.
+
+    Each session's permutation is seeded from the session string, so the same
+    session always yields the same question order.
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.permutations = OrderedDict()
+        self.lock = threading.Lock()
+
+    def draw(self, session, subject, difficulty, sizes, count):
+        """Draw `count` positions from a bank made of tiers with the given sizes"""
+        with self.lock:
+            return self._draw(session, subject, difficulty, tuple(sizes), count)
+
+    def _draw(self, session, subject, difficulty, sizes, count):
+        key = (session, subject, difficulty)
+        permutation = self.permutations.get(key)
+        if permutation is None or permutation.sizes != sizes:
+            permutation = TieredPermutation(sizes, random.Random(f"{session}:{subject}:{difficulty}"))
+            self.permutations[key] = permutation
+            if len(self.permutations) > self.max_entries:
+                self.permutations.popitem(last=False)
+        else:
+            self.permutations.move_to_end(key)
+        return permutation.draw(count)
+
+session_sampler = SessionSampler()
+
+# === SEARCH INDEX ===
+
+STOPWORDS = frozenset(
+    "a an and are as at be by do does for from how in is it of on or the to what which who why with".split()
+)
+
+def tokenize(text):
+    """Split text into lowercase search terms, dropping stopwords"""
+    return [term for term in normalize_topic(text).split() if term not in STOPWORDS]
+
+class SearchIndex:
+    """Inverted index with BM25 ranking.
+
+    Documents are added one at a time (so the index can grow incrementally) and
+    each term maps to a postings list of (doc_id, term frequency). A query only
+    touches the postings of its own terms, then takes the top k with a heap.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self.postings = {}
+        self.doc_refs = []
+        self.doc_lengths = []
+        self.total_length = 0
+
+    def add(self, ref, text):
+        """Index `text` under the opaque reference `ref`"""
+        doc_id = len(self.doc_refs)
+        terms = Counter(tokenize(text))
+        for term, tf in terms.items():
+            self.postings.setdefault(term, []).append((doc_id, tf))
+        length = sum(terms.values())
+        self.doc_refs.append(ref)
+        self.doc_lengths.append(length)
+        self.total_length += length
+
+    def search(self, query, k=5):
+        """Return up to k (score, ref) pairs for the best BM25 matches, best first"""
+        num_docs = len(self.doc_refs)
+        if not num_docs:
+            return []
+        avg_length = self.total_length / num_docs or 1
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (num_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings:
+                norm = self.K1 * (1 - self.B + self.B * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.K1 + 1) / (tf + norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(score, self.doc_refs[doc_id]) for doc_id, score in best]
+
+    def to_state(self):
+        """Plain lists and dicts for a snapshot; see from_state"""
+        return {"postings": self.postings, "doc_refs": self.doc_refs,
+                "doc_lengths": self.doc_lengths, "total_length": self.total_length}
+
+    @classmethod
+    def from_state(cls, state):
+        index = cls()
+        index.__dict__.update(state)
+        return index
+
+RESOURCE_TYPE_LABELS = {"videos": "Video", "practice": "Practice", "articles": "Article", "books": "Book"}
+
+def build_search_index(store, resources):
+    """Index every question (text, choices, explanation) and every resource entry.
+
+    Questions in an indexed SQLite file are left out; they are searched in the file.
+    """
+    index = SearchIndex()
+    positions = Counter()
+    questions = () if getattr(store, "indexed", False) else store.iter_questions()
+    for subject, difficulty, q_data in questions:
+        # iter_questions yields each bank in position order
+        position = positions[(subject, difficulty)]
+        positions[(subject, difficulty)] += 1
+        question, choices, _, explanation = q_data
+        index.add(("question", subject, difficulty, position),
+                  " ".join((question, *choices, explanation)))
+    for subject, entries in resources.items():
+        for resource_type in RESOURCE_TYPE_LABELS:
+            for entry in entries.get(resource_type, []):
+                index.add(("resource", subject, resource_type, entry), entry)
+    return index
+
+# === ANSWER KEYS ===
+
+class StoreAnswerKeys:
+    """Answer keys looked up in an indexed SQLite file by its question ID column"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def get(self, question_id, default=None):
+        return self.store.answer_key(question_id) or default
+
+def build_answer_keys(store):
+    """Map every stored question ID to (subject, difficulty, position, correct_idx)"""
+    if getattr(store, "indexed", False):
+        return StoreAnswerKeys(store)
+    keys = {}
+    positions = Counter()
+    for subject, difficulty, q_data in store.iter_questions():
+        # iter_questions yields each bank in position order
+        position = positions[(subject, difficulty)]
+        positions[(subject, difficulty)] += 1
+        keys[store.question_id(subject, difficulty, position, q_data)] = (subject, difficulty, position, q_data[2])
+    return keys
+
+def encode_quiz_id(question_ids):
+    """Pack a quiz's question IDs into one token for grade_quiz"""
+    packed = base64.urlsafe_b64encode(",".join(question_ids).encode("ascii")).decode("ascii")
+    return "quiz_" + packed.rstrip("=")
+
+def decode_quiz_id(quiz):
+    """Return the question IDs of a quiz token, or of a comma/space separated ID list"""
+    quiz = quiz.strip()
+    if quiz.startswith("quiz_"):
+        packed = quiz[len("quiz_"):]
+        try:
+            quiz = base64.urlsafe_b64decode(packed + "=" * (-len(packed) % 4)).decode("ascii")
+        except ValueError as e:
+            raise ValueError("Invalid quiz ID") from e
+    return [qid for qid in re.split(r"[,\s]+", quiz) if qid]
+
+def parse_submissions(answers, num_questions):
+    """Split 'name: A,B,C; ...' (names optional) into [(name, [letters])] padded to the quiz length"""
+    submissions = []
+    for i, entry in enumerate(e for e in re.split(r"[;\n]", answers) if e.strip()):
+        name, _, letters = entry.rpartition(":")
+        letters = letters.strip().upper()
+        tokens = re.split(r"[,\s]+", letters) if re.search(r"[,\s]", letters) else list(letters)
+        tokens = [token if token in ("A", "B", "C", "D") else "" for token in tokens][:num_questions]
+        tokens += [""] * (num_questions - len(tokens))
+        submissions.append((name.strip() or f"Student {i + 1}", tokens))
+    return submissions
+
+def grade_matrix(key_letters, submissions):
+    """Compare every submission with the key.
+
+    Returns (rows, scores, per_question): a list of booleans per submission, the
+    number each submission got right, and the share of submissions right on each
+    question. All submissions are compared at once with NumPy when it is
+    installed, one by one otherwise.
+    """
+    if has_numpy():
+        np = load_numpy()
+        correct = np.array(submissions, dtype="<U1") == np.array(key_letters, dtype="<U1")
+        return correct.tolist(), correct.sum(axis=1).tolist(), correct.mean(axis=0).tolist()
+    rows = [[given == key for given, key in zip(letters, key_letters)] for letters in submissions]
+    per_question = [sum(column) / len(rows) for column in zip(*rows)]
+    return rows, [sum(row) for row in rows], per_question
+
+# === RESOURCE RESPONSES ===
+
+# Resource types in the order find_study_resources lists them
+RESOURCE_SECTIONS = [
+    ("videos", "VIDEO RESOURCES"),
+    ("practice", "PRACTICE SITES"),
+    ("articles", "ARTICLES & REFERENCES"),
+    ("books", "BOOKS & TEXTBOOKS"),
+]
+RESOURCE_TYPES = [name for name, _ in RESOURCE_SECTIONS] + ["all"]
+
+GENERAL_STRATEGIES_FOOTER = (
+    f"{'='*60}\n"
+    "GENERAL STUDY STRATEGIES:\n"
+    "1. Set specific goals for each study session\n"
+    "2. Eliminate distractions (phone, TV, etc.)\n"
+    "3. Use active learning (practice, not just reading)\n"
+    "4. Take regular breaks (Pomodoro technique: 25 min work, 5 min break)\n"
+    "5. Review material multiple times over several days\n"
+    "6. Test yourself frequently to reinforce memory\n"
+    "7. Study in a dedicated, comfortable space\n"
+    "8. Get enough sleep - it helps memory consolidation\n"
+)
+
+# Stands in for the topic while templates are rendered; unchanged by .upper()
+TOPIC_SLOT = "\x00"
+
+def to_json(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+def render_resources(topic, resources, resource_type, output_format="text", kept=None):
+    """Render find_study_resources output for one category's resources.
+
+    `kept` limits the response to the first `kept` resources across sections (for
+    max_chars budgets), which also leaves out the general study strategies.
+    """
+    sections = [(name, label) for name, label in RESOURCE_SECTIONS if resource_type in ("all", name)]
+    items = [(name, entry) for name, _ in sections for entry in resources.get(name, [])]
+    truncated = kept is not None
+    kept = len(items) if kept is None else kept
     
-    result = f"\nQuestion {index}:\n{question}\n"
+    if output_format == "json":
+        payload = {"topic": topic, "resource_type": resource_type}
+        for name, _ in sections:
+            payload[name] = [entry for section, entry in items[:kept] if section == name]
+        if resource_type == "all":
+            payload["tips"] = resources["tips"]
+        if kept < len(items):
+            payload["omitted"] = len(items) - kept
+        return to_json(payload)
     
-    if len(choices) == 2:
-        # True/False question
-        result += f"A) {choices[0]}\nB) {choices[1]}\n"
-    else:
-        # Multiple choice
-        for i, choice in enumerate(choices):
-            result += f"{chr(65+i)}) {choice}\n"
+    result = f"LEARNING RESOURCES - {topic.upper()}\n"
+    result += f"{'='*60}\n\n"
+    for name, label in sections:
+        entries = [entry for section, entry in items[:kept] if section == name]
+        if not entries:
+            continue
+        result += f"{label}:\n"
+        for entry in entries:
+            result += f"  - {entry}\n"
+        result += "\n"
     
-    if show_answer:
-        correct_letter = chr(65 + correct_idx)
-        result += f"\nAnswer: {correct_letter}) {choices[correct_idx]}\n"
-        result += f"Explanation: {explanation}\n"
+    if not items:
+        result += f"No {resource_type} listed for this topic yet.\n\n"
+    if resource_type == "all":
+        result += f"STUDY TIPS FOR {topic.upper()}:\n"
+        result += f"{resources['tips']}\n\n"
     
+    if not truncated:
+        result += GENERAL_STRATEGIES_FOOTER
+    elif kept < len(items):
+        result += f"{'='*60}\n{len(items) - kept} more resources left out to fit max_chars\n"
     return result
 
-def get_resources_for_subject(subject, resource_type):
-    """Get learning resources for a subject"""
-    subject_lower = subject.lower()
-    
-    # Map subject to resource database
-    if "math" in subject_lower or "algebra" in subject_lower or "geometry" in subject_lower or "calculus" in subject_lower:
-        resources = RESOURCES_DATABASE["math"]
-    elif "science" in subject_lower or "biology" in subject_lower or "chemistry" in subject_lower or "physics" in subject_lower:
-        resources = RESOURCES_DATABASE["science"]
-    elif "history" in subject_lower or "social" in subject_lower:
-        resources = RESOURCES_DATABASE["history"]
-    elif "english" in subject_lower or "grammar" in subject_lower or "writing" in subject_lower or "literature" in subject_lower:
-        resources = RESOURCES_DATABASE["english"]
-    # ✨ NEW: Computer Science resource mapping
-    elif ("computer" in subject_lower or "programming" in subject_lower or "coding" in subject_lower or 
-          "cs" in subject_lower or "algorithm" in subject_lower or "data structure" in subject_lower or
-          "python" in subject_lower or "javascript" in subject_lower or "java" in subject_lower or
-          "software" in subject_lower or "web dev" in subject_lower):
-        resources = RESOURCES_DATABASE["cs"]
+def build_resource_responses(resources):
+    """Pre-render every category x resource type x format response around a topic slot.
+
+    Each template is stored split at the slot, so a call only has to join the
+    pieces with its topic (uppercased for text, JSON-encoded for json).
+    """
+    json_slot = to_json(TOPIC_SLOT)
+    responses = {}
+    for category, entries in resources.items():
+        for resource_type in RESOURCE_TYPES:
+            text = render_resources(TOPIC_SLOT, entries, resource_type)
+            responses[(category, resource_type, "text")] = tuple(text.split(TOPIC_SLOT))
+            payload = render_resources(TOPIC_SLOT, entries, resource_type, "json")
+            responses[(category, resource_type, "json")] = tuple(payload.split(json_slot))
+    return responses
+
+# === KNOWLEDGE LOADING ===
+
+SNAPSHOT_VERSION = 5
+DEFAULT_SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "study_snapshot.pickle")
+RESOURCE_FIELDS = ("videos", "practice", "articles", "tips")
+
+# Everything a tool call reads, published as one immutable unit. Tools take a
+# single reference to the current KnowledgeBase and use it for the whole call,
+# so a reload never exposes a half-updated mix of old and new data.
+KnowledgeBase = namedtuple("KnowledgeBase", ["store", "search_index", "answer_keys", "resources", "resource_responses", "source"])
+
+def data_file(name):
+    """Path of a data file in STUDY_DATA_DIR, or None if unset or missing"""
+    data_dir = os.environ.get("STUDY_DATA_DIR", "").strip()
+    path = os.path.join(data_dir, name) if data_dir else None
+    return path if path and os.path.exists(path) else None
+
+def file_signature(kind, path):
+    stat = os.stat(path)
+    return (kind, os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+@lru_cache(maxsize=None)
+def builtin_signature(kind):
+    """Content hash of the built-in questions or resources, so editing them invalidates snapshots"""
+    data = QUESTION_BANKS if kind == "questions" else RESOURCES_DATABASE
+    digest = hashlib.blake2b(json.dumps(data, sort_keys=True).encode("utf-8"), digest_size=16)
+    return ("builtin", digest.hexdigest())
+
+def knowledge_source():
+    """Identify the data files in use, so stale snapshots are ignored and edits trigger reloads"""
+    db_path = os.environ.get("STUDY_QUESTION_DB", "").strip()
+    questions_path = data_file("questions.json")
+    resources_path = data_file("resources.json")
+    if db_path:
+        questions = file_signature("sqlite", db_path)
+    elif questions_path:
+        questions = file_signature("json", questions_path)
     else:
-        resources = RESOURCES_DATABASE["general"]
-    
+        questions = builtin_signature("questions")
+    resources = file_signature("json", resources_path) if resources_path else builtin_signature("resources")
+    return (questions, resources)
+
+def load_question_banks_file(path):
+    """Read {subject: {difficulty: [[question, choices, correct_idx, explanation], ...]}} from JSON"""
+    with open(path, encoding="utf-8") as f:
+        raw = json.load(f)
+    banks = {}
+    for subject, bank in raw.items():
+        for difficulty, questions in bank.items():
+            for i, (question, choices, correct_idx, explanation) in enumerate(questions):
+                if not 0 <= correct_idx < len(choices):
+                    raise ValueError(f"{subject}/{difficulty} question {i}: correct_idx out of range")
+            banks.setdefault(subject, {})[difficulty] = [tuple(q_data) for q_data in questions]
+    return banks
+
+def load_resources_file(path):
+    """Read a RESOURCES_DATABASE-shaped dict from JSON"""
+    with open(path, encoding="utf-8") as f:
+        resources = json.load(f)
+    if "general" not in resources:
+        raise ValueError("resources file must include a 'general' category")
+    for category, entries in resources.items():
+        missing = [field for field in RESOURCE_FIELDS if field not in entries]
+        if missing:
+            raise ValueError(f"resource category '{category}' is missing {', '.join(missing)}")
     return resources
 
-# === MCP TOOLS ===
+def build_knowledge():
+    """Build a KnowledgeBase from the configured data files, or the built-in data"""
+    source = knowledge_source()
+    db_path = os.environ.get("STUDY_QUESTION_DB", "").strip()
+    questions_path = data_file("questions.json")
+    resources_path = data_file("resources.json")
+    if db_path:
+        logger.info("Loading questions from SQLite store %s", db_path)
+        store = SQLiteQuestionStore(db_path)
+        if not store.indexed:
+            logger.warning("%s has no question ID or full-text index; loading it into memory for "
+                           "search and grading. Rewrite it with write_question_db to avoid this.", db_path)
+    elif questions_path:
+        logger.info("Loading questions from %s", questions_path)
+        store = InMemoryQuestionStore(QuestionTable.from_banks(load_question_banks_file(questions_path)))
+    else:
+        store = InMemoryQuestionStore(QuestionTable.from_banks(QUESTION_BANKS))
+    resources = load_resources_file(resources_path) if resources_path else RESOURCES_DATABASE
+    return KnowledgeBase(augment_store(store), build_search_index(store, resources),
+                         build_answer_keys(store), resources, build_resource_responses(resources), source)
 
-@mcp.tool()
-async def generate_study_questions(topic: str = "", difficulty: str = "medium", count: str = "5") -> str:
-    """Generate practice questions for a topic with answers and explanations to help you study."""
-    logger.info(f"Generating questions for {topic} at {difficulty} level")
-    
-    if not topic.strip():
-        return "Error: Please specify a topic (e.g., math, science, history, english, computer science)"
-    
-    # Validate difficulty
+def write_snapshot(path):
+    """Pickle the built question table, search index and resources for fast startup.
+
+    Only plain arrays, bytes, dicts and lists are pickled, so loading a snapshot
+    never imports this module under another name.
+    """
+    kb = build_knowledge()
+    base = getattr(kb.store, "base", kb.store)
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "source": kb.source,
+        "table": base.table.to_state() if isinstance(base, InMemoryQuestionStore) else None,
+        # Generated math questions that repeat a stored one; None if generation was off
+        "generated_duplicates": getattr(kb.store, "duplicates", None),
+        "search_index": kb.search_index.to_state(),
+        # Indexed SQLite files answer key lookups themselves
+        "answer_keys": kb.answer_keys if isinstance(kb.answer_keys, dict) else None,
+        "resources": kb.resources,
+    }
+    with open(path, "wb") as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def load_knowledge():
+    """Load from the snapshot when it matches the current data, else build from scratch.
+
+    Snapshots are trusted build artifacts (see write_snapshot); the path comes from
+    STUDY_SNAPSHOT or defaults to study_snapshot.pickle next to this file.
+    """
+    path = os.environ.get("STUDY_SNAPSHOT", DEFAULT_SNAPSHOT_PATH)
+    try:
+        with open(path, "rb") as f:
+            snapshot = pickle.load(f)
+        source = knowledge_source()
+        if snapshot["version"] == SNAPSHOT_VERSION and snapshot["source"] == source:
+            if snapshot["table"] is not None:
+                store = InMemoryQuestionStore(QuestionTable.from_state(snapshot["table"]))
+            else:
+                store = SQLiteQuestionStore(os.environ["STUDY_QUESTION_DB"].strip())
+            answer_keys = snapshot["answer_keys"]
+            if answer_keys is None:
+                answer_keys = build_answer_keys(store)
+            kb = KnowledgeBase(augment_store(store, snapshot["generated_duplicates"]),
+                               SearchIndex.from_state(snapshot["search_index"]), answer_keys,
+                               snapshot["resources"], build_resource_responses(snapshot["resources"]), source)
+            return kb, "snapshot"
+        logger.info("Ignoring stale snapshot %s", path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Could not load snapshot {path}: {e}")
+    return build_knowledge(), "built"
+
+def write_data_files(directory):
+    """Export the current questions and resources as questions.json/resources.json in `directory`"""
+    os.makedirs(directory, exist_ok=True)
+    banks = {}
+    for subject, difficulty, (question, choices, correct_idx, explanation) in knowledge.store.iter_questions():
+        banks.setdefault(subject, {}).setdefault(difficulty, []).append(
+            [question, list(choices), correct_idx, explanation])
+    for name, data in (("questions.json", banks), ("resources.json", knowledge.resources)):
+        with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+
+class KnowledgeReloader(threading.Thread):
+    """Polls the data files and publishes a freshly built KnowledgeBase when they change.
+
+    Parsing and indexing run on this background thread while the current
+    KnowledgeBase keeps serving; the new one is published with a single
+    reference assignment. A file that fails to load leaves the old data in place.
+    The replaced store is closed one interval later, once calls already using it
+    have finished.
+    """
+
+    def __init__(self, interval):
+        super().__init__(name="knowledge-reloader", daemon=True)
+        self.interval = interval
+        self.failed_source = None
+        self.retired = None
+        self.check_error = None
+
+    def run(self):
+        global knowledge
+        while True:
+            time.sleep(self.interval)
+            if self.retired is not None:
+                self.retired.close()
+                self.retired = None
+            try:
+                source = knowledge_source()
+            except Exception as e:
+                # A data file vanished or is unreadable; keep serving and look again next time
+                if str(e) != self.check_error:
+                    self.check_error = str(e)
+                    logger.error(f"Could not check study data, still serving previous data: {e}")
+                continue
+            self.check_error = None
+            if source == knowledge.source or source == self.failed_source:
+                continue
+            try:
+                begin = time.perf_counter()
+                kb = build_knowledge()
+            except Exception as e:
+                self.failed_source = source
+                logger.error(f"Reload failed, still serving previous data: {e}")
+                continue
+            self.retired = knowledge.store
+            knowledge = kb
+            logger.info("Reloaded study data in %.1f ms", (time.perf_counter() - begin) * 1000)
+
+_load_begin = time.perf_counter()
+knowledge, knowledge_origin = load_knowledge()
+startup_timings["data_load"] = time.perf_counter() - _load_begin
+
+# === UTILITY FUNCTIONS ===
+
+PAGE_SIZE = 10        # questions per response; larger requests are paginated
+MAX_QUESTIONS = 500   # largest question set a single request can page through
+
+def encode_cursor(topic, difficulty, total, seed, offset, show_answers=True):
+    """Pack the state needed to resume a paginated question set into an opaque token"""
+    state = json.dumps([topic, difficulty, total, seed, offset, show_answers], separators=(",", ":"))
+    return base64.urlsafe_b64encode(state.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor):
+    """Unpack a token from encode_cursor, raising ValueError if it is malformed"""
+    try:
+        topic, difficulty, total, seed, offset, show_answers = json.loads(base64.urlsafe_b64decode(cursor.strip()))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    # Cursors come back from clients, so check every field before it reaches the store
+    if not (isinstance(topic, str) and isinstance(difficulty, str) and isinstance(show_answers, bool)
+            and all(type(value) is int for value in (total, seed, offset))
+            and 0 < total and 0 <= offset < total):
+        raise ValueError("Invalid cursor")
+    return topic, difficulty, min(total, MAX_QUESTIONS), seed, offset, show_answers
+
+def get_question_positions(subject_key, difficulty, count, session, store):
+    """Pick question positions in a bank, without repeats within a session"""
+    if session:
+        # Sessions go through every stored question before any generated one
+        size = store.bank_size(subject_key, difficulty)
+        stored = store.stored_size(subject_key, difficulty) if hasattr(store, "stored_size") else size
+        return session_sampler.draw(session, subject_key, difficulty, (stored, size - stored), count)
+    return store.sample_positions(subject_key, difficulty, count)
+
+def get_questions_for_subject(subject, difficulty, count, session="", store=None):
+    """Get questions based on subject and difficulty, without repeats within a session"""
+    store = store or knowledge.store
+    subject_key = subject_router.route(subject)
+    if subject_key is None:
+        return None
+    return store.fetch(subject_key, difficulty, get_question_positions(subject_key, difficulty, count, session, store))
+
+def format_question(index, q_data, show_answer=True):
+    """Format a single question nicely"""
+    body, answer = question_fragments(q_data)
+    if show_answer:
+        return f"\nQuestion {index}:\n{body}{answer}"
+    return f"\nQuestion {index}:\n{body}"
+
+def parse_difficulty(difficulty):
+    """Normalize a difficulty argument, falling back to medium"""
     difficulty_lower = difficulty.strip().lower()
     if difficulty_lower not in ["easy", "medium", "hard"]:
         difficulty_lower = "medium"
-    
-    # Validate count
+    return difficulty_lower
+
+def parse_count(count, limit=MAX_QUESTIONS):
+    """Parse a question count argument: 5 when missing or invalid, capped at `limit`"""
     try:
         num_questions = int(count) if count.strip() else 5
-        if num_questions < 1 or num_questions > 10:
+        if num_questions < 1:
             num_questions = 5
     except ValueError:
         num_questions = 5
+    return min(num_questions, limit)
+
+def parse_flag(value, default=True):
+    """Interpret a yes/no string argument"""
+    value = value.strip().lower()
+    if value in ("false", "no", "0", "off", "hide"):
+        return False
+    if value in ("true", "yes", "1", "on", "show"):
+        return True
+    return default
+
+OUTPUT_FORMATS = ("text", "json")
+MIN_MAX_CHARS = 200
+
+ResponseFormat = namedtuple("ResponseFormat", ["output_format", "max_chars", "show_answers"])
+
+def parse_response_format(output_format, max_chars, show_answers="true"):
+    """Parse the presentation arguments shared by the question and resource tools.
+
+    Unknown formats fall back to text. max_chars is None (no budget) when missing
+    or invalid, and never below MIN_MAX_CHARS.
+    """
+    output_format = output_format.strip().lower()
+    if output_format not in OUTPUT_FORMATS:
+        output_format = "text"
+    try:
+        budget = int(max_chars) if max_chars.strip() else 0
+    except ValueError:
+        budget = 0
+    budget = max(budget, MIN_MAX_CHARS) if budget > 0 else None
+    return ResponseFormat(output_format, budget, parse_flag(show_answers))
+
+def parse_batch_specs(specs):
+    """Split 'topic, difficulty, count; ...' into (topic, difficulty, count) tuples"""
+    parsed = []
+    for entry in re.split(r"[;\n]", specs):
+        fields = [field.strip() for field in entry.split(",")]
+        if not fields[0]:
+            continue
+        difficulty = fields[1] if len(fields) > 1 else "medium"
+        count = fields[2] if len(fields) > 2 else "5"
+        parsed.append((fields[0], parse_difficulty(difficulty), parse_count(count, PAGE_SIZE)))
+    return parsed
+
+def get_resource_category(subject, resources):
+    """Resolve a topic to its resources category, falling back to general"""
+    subject_key = route_topic(subject)
+    return subject_key if subject_key in resources else "general"
+
+# === RESPONSE BLOCKS ===
+
+DIVIDER = "=" * 60
+
+DIFFICULTY_HEADERS = {
+    difficulty: f"Difficulty: {difficulty.capitalize()}\n{DIVIDER}\n"
+    for difficulty in ["easy", "medium", "hard"]
+}
+
+STUDY_TIPS_FOOTER = (
+    f"\n{DIVIDER}\n"
+    "Study Tips:\n"
+    "- Cover the answers and try to solve each question first\n"
+    "- Review the explanations carefully\n"
+    "- Practice similar problems to reinforce learning\n"
+    "- If you get one wrong, understand why before moving on\n"
+)
+
+MAX_BATCH_SPECS = 20
+
+def render_question_set(topic, difficulty, questions, start=1, note="", question_ids=None):
+    """Return the header and numbered questions of one question set as a list of parts.
+
+    With question_ids the answers are left out and each question shows its ID instead.
+    """
+    parts = [f"STUDY QUESTIONS - {topic.upper()}\n", DIFFICULTY_HEADERS[difficulty], note]
+    for i, q_data in enumerate(questions, start):
+        body, answer = question_fragments(q_data)
+        if question_ids is None:
+            parts.extend((f"\nQuestion {i}:\n", body, answer))
+        else:
+            parts.extend((f"\nQuestion {i}:\n", body, f"[ID: {question_ids[i - start]}]\n"))
+    return parts
+
+def question_record(q_data, question_id, show_answers):
+    """Compact JSON form of one question"""
+    question, choices, correct_idx, explanation = q_data
+    record = {"id": question_id, "question": question, "choices": list(choices)}
+    if show_answers:
+        record["answer"] = correct_idx
+        record["explanation"] = explanation
+    return record
+
+def fit_budget(render, count, max_chars):
+    """Render with as many of `count` items as fit in max_chars, never fewer than one.
+
+    `render(kept)` builds the response from the first `kept` items. Responses are
+    at most a page long, so trying successively shorter ones is cheap.
+    """
+    kept = count
+    response = render(kept)
+    while max_chars is not None and len(response) > max_chars and kept > 1:
+        kept -= 1
+        response = render(kept)
+    return response
+
+def render_question_response(topic, difficulty, questions, question_ids, fmt, start=1, total=None, continuation=None):
+    """Render a question set as text or JSON, truncated at question boundaries to fit fmt.max_chars.
+
+    `continuation(kept)` returns the (text, JSON fields) telling the caller how to
+    get the questions after the first `kept`; without one, left-out questions are
+    only counted. Paginated sets pass `total` to number their questions.
+    """
+    def render(kept):
+        omitted = len(questions) - kept
+        more_text, more_fields = continuation(kept) if continuation else (None, {})
+        if fmt.output_format == "json":
+            payload = {"topic": topic, "difficulty": difficulty}
+            if total is not None:
+                payload.update({"start": start, "total": total})
+            payload["questions"] = [question_record(q_data, question_id, fmt.show_answers)
+                                    for q_data, question_id in zip(questions[:kept], question_ids)]
+            if not fmt.show_answers:
+                payload["quiz_id"] = encode_quiz_id(question_ids[:kept])
+            if omitted and not more_fields:
+                payload["omitted"] = omitted
+            payload.update(more_fields)
+            return to_json(payload)
+        
+        note = f"Questions {start}-{start + kept - 1} of {total}\n" if total is not None else ""
+        parts = render_question_set(topic, difficulty, questions[:kept], start, note,
+                                    None if fmt.show_answers else question_ids[:kept])
+        if not fmt.show_answers:
+            parts.append(quiz_footer(question_ids[:kept]))
+        if more_text:
+            parts.append(more_text)
+        elif omitted:
+            parts.append(f"\n{DIVIDER}\n{omitted} more questions left out to fit max_chars\n")
+        elif fmt.show_answers:
+            parts.append(STUDY_TIPS_FOOTER)
+        return "".join(parts)
+    
+    return fit_budget(render, len(questions), fmt.max_chars)
+
+def quiz_footer(question_ids):
+    quiz_id = encode_quiz_id(question_ids)
+    return (f"\n{DIVIDER}\n"
+            f"Quiz ID: {quiz_id}\n"
+            f"Submit answers with grade_quiz (quiz: {quiz_id}, answers: e.g. A,C,B)\n")
+
+# === INSTRUMENTATION ===
+
+# Log one in every STUDY_LOG_SAMPLE tool calls (1 logs every call)
+LOG_SAMPLE_EVERY = max(1, int(os.environ.get("STUDY_LOG_SAMPLE", "100")))
+_log_calls = itertools.count()
+
+def log_sampled(msg, *args):
+    """Lazily log a hot-path message for a sample of calls only"""
+    if next(_log_calls) % LOG_SAMPLE_EVERY == 0 and logger.isEnabledFor(logging.INFO):
+        logger.info(msg, *args)
+
+class ToolMetrics:
+    """Per-tool counters and latency histograms.
+
+    record() runs on the event loop thread. Route counts come from tool bodies on
+    worker threads, so count_route() takes a lock.
+    """
+
+    LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000)
+
+    def __init__(self):
+        self.started = time.time()
+        self.calls = Counter()
+        self.errors = Counter()
+        self.latency_ms_sum = Counter()
+        self.response_chars = Counter()
+        self.latency_hist = {}
+        self.routes = Counter()
+        self.routes_lock = threading.Lock()
+
+    def count_route(self, subject_key):
+        with self.routes_lock:
+            self.routes[subject_key or "unknown"] += 1
+
+    def record(self, tool, elapsed_ms, response_chars, error):
+        self.calls[tool] += 1
+        self.errors[tool] += error
+        self.latency_ms_sum[tool] += elapsed_ms
+        self.response_chars[tool] += response_chars
+        hist = self.latency_hist.get(tool)
+        if hist is None:
+            hist = self.latency_hist[tool] = [0] * (len(self.LATENCY_BUCKETS_MS) + 1)
+        hist[bisect.bisect_left(self.LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+    def latency_percentile(self, tool, pct):
+        """Upper bound (ms) of the histogram bucket holding the pct-th percentile"""
+        target = self.calls[tool] * pct / 100
+        seen = 0
+        for bound, count in zip(self.LATENCY_BUCKETS_MS + (float("inf"),), self.latency_hist[tool]):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def render_text(self):
+        lines = [f"SERVER STATS - uptime {time.time() - self.started:.0f}s", DIVIDER, "",
+                 f"{'tool':<30} {'calls':>7} {'errors':>6} {'avg ms':>8} {'p50 ms':>7} {'p95 ms':>7} {'avg chars':>9}"]
+        for tool in sorted(self.calls):
+            calls = self.calls[tool]
+            lines.append(
+                f"{tool:<30} {calls:>7} {self.errors[tool]:>6} {self.latency_ms_sum[tool] / calls:>8.3f} "
+                f"{'<=' + format(self.latency_percentile(tool, 50), 'g'):>7} "
+                f"{'<=' + format(self.latency_percentile(tool, 95), 'g'):>7} "
+                f"{self.response_chars[tool] // calls:>9}")
+        if not self.calls:
+            lines.append("(no tool calls yet)")
+        lines += ["", "TOPIC ROUTING:"]
+        lines += [f"  {subject}: {count}" for subject, count in self.routes.most_common()]
+        cache = subject_router.route_normalized.cache_info()
+        lines += [f"  router cache: {cache.hits} hits, {cache.misses} misses, {cache.currsize} topics cached", ""]
+        return "\n".join(lines)
+
+    def render_prometheus(self):
+        lines = [
+            "# HELP study_tool_calls_total Tool calls by tool.",
+            "# TYPE study_tool_calls_total counter",
+            *(f'study_tool_calls_total{{tool="{tool}"}} {count}' for tool, count in sorted(self.calls.items())),
+            "# HELP study_tool_errors_total Tool calls that returned an error.",
+            "# TYPE study_tool_errors_total counter",
+            *(f'study_tool_errors_total{{tool="{tool}"}} {self.errors[tool]}' for tool in sorted(self.calls)),
+            "# HELP study_tool_response_chars_total Characters returned by tool.",
+            "# TYPE study_tool_response_chars_total counter",
+            *(f'study_tool_response_chars_total{{tool="{tool}"}} {self.response_chars[tool]}' for tool in sorted(self.calls)),
+            "# HELP study_tool_latency_ms Tool call latency in milliseconds.",
+            "# TYPE study_tool_latency_ms histogram",
+        ]
+        for tool in sorted(self.calls):
+            cumulative = 0
+            for bound, count in zip(self.LATENCY_BUCKETS_MS + ("+Inf",), self.latency_hist[tool]):
+                cumulative += count
+                lines.append(f'study_tool_latency_ms_bucket{{tool="{tool}",le="{bound}"}} {cumulative}')
+            lines.append(f'study_tool_latency_ms_sum{{tool="{tool}"}} {self.latency_ms_sum[tool]:.3f}')
+            lines.append(f'study_tool_latency_ms_count{{tool="{tool}"}} {self.calls[tool]}')
+        lines += [
+            "# HELP study_topic_routes_total Topics routed to each subject bank (unknown = no match).",
+            "# TYPE study_topic_routes_total counter",
+            *(f'study_topic_routes_total{{subject="{subject}"}} {count}' for subject, count in sorted(self.routes.items())),
+        ]
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """Write the Prometheus text format to `path` (replaced atomically)"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp_path, path)
+
+tool_metrics = ToolMetrics()
+
+def route_topic(topic):
+    """Route a user topic to a subject key and count the outcome"""
+    subject_key = subject_router.route(topic)
+    tool_metrics.count_route(subject_key)
+    return subject_key
+
+def instrumented(fn):
+    """Record call count, latency, response size and errors for a tool coroutine"""
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = ""
+        try:
+            result = await fn(*args, **kwargs)
+            return result
+        finally:
+            tool_metrics.record(name, (time.perf_counter() - start) * 1000, len(result),
+                                not result or result.startswith("Error:"))
+    return wrapper
+
+# === CONCURRENCY ===
+
+DEFAULT_MAX_CONCURRENCY = 16
+
+# Bounds how many tool calls run at once; replaced at startup from --max-concurrency
+tool_slots = anyio.CapacityLimiter(DEFAULT_MAX_CONCURRENCY)
+
+def limit_concurrency(fn):
+    """Turn a blocking tool function into a coroutine that runs it on a worker thread.
+
+    At most `tool_slots` calls run at once; the rest wait for a free thread, and
+    the event loop stays free to accept requests and stream responses meanwhile.
+    """
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await anyio.to_thread.run_sync(functools.partial(fn, *args, **kwargs), limiter=tool_slots)
+    return wrapper
+
+# === MCP TOOLS ===
+
+@mcp.tool()
+@instrumented
+@limit_concurrency
+def generate_study_questions(topic: str = "", difficulty: str = "medium", count: str = "5", cursor: str = "", session: str = "", show_answers: str = "true", output_format: str = "text", max_chars: str = "") -> str:
+    """Generate practice questions for a topic with answers and explanations; show_answers=false makes a gradable quiz."""
+    log_sampled("Generating questions for %s at %s level", topic, difficulty)
+    
+    fmt = parse_response_format(output_format, max_chars, show_answers)
+    if cursor.strip():
+        return generate_question_page(cursor, fmt=fmt)
+    
+    if not topic.strip():
+        return "Error: Please specify a topic (e.g., math, science, history, english, computer science)"
+    
+    difficulty_lower = parse_difficulty(difficulty)
+    num_questions = parse_count(count)
+    session = session.strip()
     
     try:
+        store = knowledge.store
+        subject_key = route_topic(topic)
+        total = 0
+        if subject_key is not None:
+            total = min(num_questions, store.bank_size(subject_key, difficulty_lower))
+        if session and total > PAGE_SIZE:
+            # A session already continues where it left off, so page by calling again
+            num_questions = PAGE_SIZE
+        elif total > PAGE_SIZE:
+            seed = random.getrandbits(32)
+            cursor = encode_cursor(topic, difficulty_lower, total, seed, 0, fmt.show_answers)
+            return generate_question_page(cursor, store, fmt)
+        
         # Get questions
-        questions = get_questions_for_subject(topic, difficulty_lower, num_questions)
+        questions = []
+        if subject_key is not None:
+            positions = get_question_positions(subject_key, difficulty_lower, num_questions, session, store)
+            questions = store.fetch(subject_key, difficulty_lower, positions)
         
         if not questions:
             return f"Error: Could not generate questions for '{topic}'. Try: math, science, history, english, or computer science"
         
         # Format output
-        result = f"STUDY QUESTIONS - {topic.upper()}\n"
-        result += f"Difficulty: {difficulty_lower.capitalize()}\n"
-        result += f"{'='*60}\n"
+        question_ids = []
+        if not fmt.show_answers or fmt.output_format == "json":
+            question_ids = [store.question_id(subject_key, difficulty_lower, p, q)
+                            for p, q in zip(positions, questions)]
+        continuation = None
+        if session and total > PAGE_SIZE:
+            def continuation(kept):
+                return (f"\n{DIVIDER}\n"
+                        f"Showing {kept} of {total} questions. Call generate_study_questions "
+                        f"again with session: {session} for more, without repeats\n",
+                        {"total": total, "session": session})
+        return render_question_response(topic, difficulty_lower, questions, question_ids, fmt,
+                                        continuation=continuation)
+        
+    except Exception as e:
+        logger.error(f"Error: {e}")
+        return f"Error: {str(e)}"
+
+def generate_question_page(cursor, store=None, fmt=None):
+    """Render one page of a paginated question set.
+
+    The cursor carries the seed of the set's sample, so each page re-derives the
+    same ordering and fetches only its own PAGE_SIZE questions from the store.
+    Whether answers are shown is part of the set; the output format and budget
+    come from the current call.
+    """
+    try:
+        topic, difficulty, total, seed, offset, show_answers = decode_cursor(cursor)
+        subject_key = subject_router.route(topic)
+        if subject_key is None or difficulty not in DIFFICULTY_HEADERS:
+            raise ValueError("Invalid cursor")
+    except ValueError:
+        return "Error: Invalid cursor. Request the question set again without a cursor to start over."
+    
+    try:
+        store = store or knowledge.store
+        fmt = (fmt or parse_response_format("text", ""))._replace(show_answers=show_answers)
+        size = store.bank_size(subject_key, difficulty)
+        total = min(total, size)
+        positions = store.sample_positions(subject_key, difficulty, total, random.Random(seed))[offset:offset + PAGE_SIZE]
+        if not positions:
+            return f"Error: No more questions for '{topic}'. Request the set again without a cursor to start over."
+        questions = store.fetch(subject_key, difficulty, positions)
+        question_ids = []
+        if not show_answers or fmt.output_format == "json":
+            question_ids = [store.question_id(subject_key, difficulty, p, q) for p, q in zip(positions, questions)]
         
-        for i, q_data in enumerate(questions, 1):
-            result += format_question(i, q_data, show_answer=True)
+        def continuation(kept):
+            end = offset + kept
+            if end >= total:
+                return None, {}
+            next_cursor = encode_cursor(topic, difficulty, total, seed, end, show_answers)
+            return (f"\n{DIVIDER}\n"
+                    f"{total - end} more questions available. Call generate_study_questions "
+                    f"again with cursor: {next_cursor}\n",
+                    {"next_cursor": next_cursor})
+        return render_question_response(topic, difficulty, questions, question_ids, fmt,
+                                        start=offset + 1, total=total, continuation=continuation)
         
-        result += f"\n{'='*60}\n"
-        result += f"Study Tips:\n"
-        result += "- Cover the answers and try to solve each question first\n"
-        result += "- Review the explanations carefully\n"
-        result += "- Practice similar problems to reinforce learning\n"
-        result += "- If you get one wrong, understand why before moving on\n"
+    except Exception as e:
+        logger.error(f"Error: {e}")
+        return f"Error: {str(e)}"
+
+@mcp.tool()
+@instrumented
+@limit_concurrency
+def generate_study_question_batch(specs: str = "") -> str:
+    """Generate several question sets in one call from specs like 'math, easy, 3; history, hard, 2'."""
+    log_sampled("Generating question batch: %s", specs)
+    
+    parsed = parse_batch_specs(specs)
+    if not parsed:
+        return "Error: Please specify at least one 'topic, difficulty, count' entry separated by ';' (e.g., math, easy, 3; history, hard, 2)"
+    if len(parsed) > MAX_BATCH_SPECS:
+        return f"Error: A batch can contain at most {MAX_BATCH_SPECS} entries (got {len(parsed)})"
+    
+    try:
+        # Route every topic once, then sample each (bank, difficulty) pair once for the
+        # whole batch so topics that share a bank get distinct questions
+        routed = [(topic, route_topic(topic), difficulty, count)
+                  for topic, difficulty, count in parsed]
+        totals = Counter()
+        for _, subject_key, difficulty, count in routed:
+            if subject_key is not None:
+                totals[(subject_key, difficulty)] += count
+        store = knowledge.store
+        pools = {key: store.sample(*key, total) for key, total in totals.items()}
         
-        return result
+        parts = [f"STUDY QUESTION BATCH - {len(routed)} SETS\n{DIVIDER}\n"]
+        for topic, subject_key, difficulty, count in routed:
+            parts.append("\n")
+            if subject_key is None:
+                parts.append(f"Error: Could not generate questions for '{topic}'. Try: math, science, history, english, or computer science\n")
+                continue
+            pool = pools[(subject_key, difficulty)]
+            questions, pools[(subject_key, difficulty)] = pool[:count], pool[count:]
+            if not questions:
+                parts.append(f"Note: No more unique questions for '{topic}' at {difficulty} level in this batch\n")
+                continue
+            note = ""
+            if len(questions) < count:
+                note = (f"Note: Only {len(questions)} of {count} requested questions left for '{topic}' "
+                        f"at {difficulty} level in this batch\n")
+            parts.extend(render_question_set(topic, difficulty, questions, note=note))
+        parts.append(STUDY_TIPS_FOOTER)
+        return "".join(parts)
         
     except Exception as e:
         logger.error(f"Error: {e}")
         return f"Error: {str(e)}"
 
 @mcp.tool()
-async def find_study_resources(topic: str = "", resource_type: str = "all") -> str:
-    """Find learning resources and study strategies for any topic including videos, articles, and practice sites."""
-    logger.info(f"Finding resources for {topic}, type: {resource_type}")
+@instrumented
+@limit_concurrency
+def find_study_resources(topic: str = "", resource_type: str = "all", output_format: str = "text", max_chars: str = "") -> str:
+    """Find learning resources and study strategies for any topic including videos, articles, books, and practice sites."""
+    log_sampled("Finding resources for %s, type: %s", topic, resource_type)
     
     if not topic.strip():
         return "Error: Please specify a topic (e.g., math, science, history, english, computer science)"
     
     # Validate resource type
     resource_type_lower = resource_type.strip().lower()
-    valid_types = ["videos", "articles", "practice", "books", "all"]
-    if resource_type_lower not in valid_types:
+    if resource_type_lower not in RESOURCE_TYPES:
         resource_type_lower = "all"
+    fmt = parse_response_format(output_format, max_chars)
     
     try:
-        # Get resources
-        resources = get_resources_for_subject(topic, resource_type_lower)
+        kb = knowledge
+        category = get_resource_category(topic, kb.resources)
+        if fmt.max_chars is not None:
+            resources = kb.resources[category]
+            count = sum(len(resources.get(name, [])) for name, _ in RESOURCE_SECTIONS
+                        if resource_type_lower in ("all", name))
+            return fit_budget(lambda kept: render_resources(topic, resources, resource_type_lower,
+                                                            fmt.output_format, kept),
+                              count, fmt.max_chars)
         
-        # Format output
-        result = f"LEARNING RESOURCES - {topic.upper()}\n"
-        result += f"{'='*60}\n\n"
+        # Responses are pre-rendered per category; only the topic is filled in
+        pieces = kb.resource_responses[(category, resource_type_lower, fmt.output_format)]
+        return (to_json(topic) if fmt.output_format == "json" else topic.upper()).join(pieces)
+        
+    except Exception as e:
+        logger.error(f"Error: {e}")
+        return f"Error: {str(e)}"
+
+@mcp.tool()
+@instrumented
+@limit_concurrency
+def search_study_material(query: str = "", limit: str = "5") -> str:
+    """Search all study questions and learning resources for a concept such as photosynthesis or binary search."""
+    log_sampled("Searching study material for %s", query)
+    
+    if not query.strip():
+        return "Error: Please specify what to search for (e.g., photosynthesis, binary search, World War)"
+    
+    try:
+        max_results = int(limit) if limit.strip() else 5
+        if max_results < 1 or max_results > 20:
+            max_results = 5
+    except ValueError:
+        max_results = 5
+    
+    try:
+        kb = knowledge
+        hits = kb.search_index.search(query, max_results)
+        base = getattr(kb.store, "base", kb.store)
+        if getattr(base, "indexed", False):
+            # Questions are ranked by the file's own BM25 index; merge by score
+            hits = heapq.nlargest(max_results, hits + base.search(query, max_results), key=lambda hit: hit[0])
+        if not hits:
+            return f"No study material found for '{query}'. Try a broader term or a subject name."
         
-        if resource_type_lower == "all" or resource_type_lower == "videos":
-            result += "VIDEO RESOURCES:\n"
-            for video in resources["videos"]:
-                result += f"  - {video}\n"
-            result += "\n"
+        parts = [f"SEARCH RESULTS - {query.upper()}\n{DIVIDER}\n"]
+        for rank, (_, ref) in enumerate(hits, 1):
+            if ref[0] == "question":
+                _, subject, difficulty, position = ref
+                q_data = kb.store.fetch(subject, difficulty, [position])[0]
+                body, answer = question_fragments(q_data)
+                parts.append(f"\n{rank}. [Question - {subject} / {difficulty}]\n{body}{answer}")
+            else:
+                _, subject, resource_type, entry = ref
+                parts.append(f"\n{rank}. [{RESOURCE_TYPE_LABELS[resource_type]} - {subject}]\n  - {entry}\n")
+        return "".join(parts)
         
-        if resource_type_lower == "all" or resource_type_lower == "practice":
-            result += "PRACTICE SITES:\n"
-            for practice in resources["practice"]:
-                result += f"  - {practice}\n"
-            result += "\n"
+    except Exception as e:
+        logger.error(f"Error: {e}")
+        return f"Error: {str(e)}"
+
+@mcp.tool()
+@instrumented
+@limit_concurrency
+def grade_quiz(quiz: str = "", answers: str = "") -> str:
+    """Grade quiz answers (one student, or many as 'name: A,B,C; name: ...') and explain the wrong ones."""
+    log_sampled("Grading quiz %s", quiz)
+    
+    try:
+        question_ids = decode_quiz_id(quiz)
+    except ValueError:
+        question_ids = []
+    if not question_ids:
+        return "Error: Please specify a quiz ID or question IDs from generate_study_questions with show_answers=false"
+    submissions = parse_submissions(answers, len(question_ids))
+    if not submissions:
+        return "Error: Please specify the answers as letters (e.g., A,C,B or 'Sam: ACB; Lee: ABB')"
+    
+    try:
+        kb = knowledge
+        # Resolve the answer key; question text is only loaded for questions someone missed
+        entries, unknown = [], []
+        for qid in question_ids:
+            entry = kb.answer_keys.get(qid)
+            if entry is None and hasattr(kb.store, "generated_question"):
+                q_data = kb.store.generated_question(qid)
+                entry = q_data and (None, None, None, q_data[2], q_data)
+            if entry is None:
+                unknown.append(qid)
+            entries.append(entry)
+        if unknown:
+            return f"Error: Unknown question IDs (the question bank may have changed): {', '.join(unknown)}"
+        key_letters = [chr(65 + entry[3]) for entry in entries]
         
-        if resource_type_lower == "all" or resource_type_lower == "articles":
-            result += "ARTICLES & REFERENCES:\n"
-            for article in resources["articles"]:
-                result += f"  - {article}\n"
-            result += "\n"
+        rows, scores, per_question = grade_matrix(key_letters, [letters for _, letters in submissions])
+        missed = [i for i, share in enumerate(per_question) if share < 1]
         
-        if resource_type_lower == "all":
-            result += f"STUDY TIPS FOR {topic.upper()}:\n"
-            result += f"{resources['tips']}\n\n"
+        def question_for(i):
+            entry = entries[i]
+            if len(entry) == 5:
+                return entry[4]
+            subject, difficulty, position, _ = entry
+            return kb.store.fetch(subject, difficulty, [position])[0]
+        missed_questions = {i: question_for(i) for i in missed}
         
-        result += f"{'='*60}\n"
-        result += "GENERAL STUDY STRATEGIES:\n"
-        result += "1. Set specific goals for each study session\n"
-        result += "2. Eliminate distractions (phone, TV, etc.)\n"
-        result += "3. Use active learning (practice, not just reading)\n"
-        result += "4. Take regular breaks (Pomodoro technique: 25 min work, 5 min break)\n"
-        result += "5. Review material multiple times over several days\n"
-        result += "6. Test yourself frequently to reinforce memory\n"
-        result += "7. Study in a dedicated, comfortable space\n"
-        result += "8. Get enough sleep - it helps memory consolidation\n"
+        num_questions = len(question_ids)
+        parts = [f"QUIZ RESULTS - {num_questions} QUESTIONS\n{DIVIDER}\n"]
+        if len(submissions) == 1:
+            letters = submissions[0][1]
+            parts.append(f"Score: {scores[0]}/{num_questions} ({scores[0] / num_questions:.0%})\n")
+            for i in missed:
+                question, choices, correct_idx, explanation = missed_questions[i]
+                given = f"{letters[i]}) {choices[ord(letters[i]) - 65]}" if letters[i] and ord(letters[i]) - 65 < len(choices) else "no answer"
+                parts.append(f"\nQuestion {i + 1}: {question}\n"
+                             f"Your answer: {given}\n"
+                             f"Correct answer: {key_letters[i]}) {choices[correct_idx]}\n"
+                             f"Explanation: {explanation}\n")
+            if not missed:
+                parts.append("\nAll answers correct - great work!\n")
+            return "".join(parts)
         
-        return result
+        # Whole class: one line per student, then each missed question explained once
+        parts.append(f"Class average: {sum(scores) / len(scores):.1f}/{num_questions} "
+                     f"({sum(scores) / (len(scores) * num_questions):.0%})\n\n")
+        for (name, _), score, row in zip(submissions, scores, rows):
+            wrong = [str(i + 1) for i, right in enumerate(row) if not right]
+            parts.append(f"{name}: {score}/{num_questions}"
+                         + (f" - missed {', '.join(wrong)}\n" if wrong else " - all correct\n"))
+        if missed:
+            parts.append("\nMISSED QUESTIONS:\n")
+        for i in sorted(missed, key=lambda i: per_question[i]):
+            question, choices, correct_idx, explanation = missed_questions[i]
+            parts.append(f"\nQuestion {i + 1} ({per_question[i]:.0%} correct): {question}\n"
+                         f"Correct answer: {key_letters[i]}) {choices[correct_idx]}\n"
+                         f"Explanation: {explanation}\n")
+        return "".join(parts)
         
     except Exception as e:
         logger.error(f"Error: {e}")
         return f"Error: {str(e)}"
 
+@mcp.tool()
+@instrumented
+async def server_stats(output_format: str = "text") -> str:
+    """Show per-tool call counts, latency, errors, response sizes and topic routing stats (text or prometheus)."""
+    try:
+        if METRICS_FILE:
+            tool_metrics.dump(METRICS_FILE)
+        if output_format.strip().lower() == "prometheus":
+            return tool_metrics.render_prometheus()
+        return tool_metrics.render_text()
+    except Exception as e:
+        logger.error(f"Error: {e}")
+        return f"Error: {str(e)}"
+
 # === SERVER STARTUP ===
-if __name__ == "__main__":
-    logger.info("Starting Study Helper MCP server...")
+
+METRICS_FILE = os.environ.get("STUDY_METRICS_FILE", "").strip()
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics_endpoint(request):
+    """Prometheus scrape endpoint, served alongside the HTTP transports"""
+    from starlette.responses import PlainTextResponse
+    return PlainTextResponse(tool_metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+def transport_security(host, allowed_hosts):
+    """Host/Origin header checks for the HTTP transports, matching the bind address.
+
+    FastMCP turns on DNS-rebinding protection for localhost when it is created and
+    keeps it when the bind host changes later, so it has to be set here. Loopback
+    binds stay protected; `allowed_hosts` adds Host values clients may use (a bare
+    name allows any port); a public bind with no allow-list accepts any Host.
+    Returns None on mcp releases without these checks.
+    """
+    try:
+        from mcp.server.transport_security import TransportSecuritySettings
+    except ImportError:
+        return None
+    hosts = []
+    for allowed in allowed_hosts:
+        hosts += [allowed] if ":" in allowed else [allowed, f"{allowed}:*"]
+    if host in LOOPBACK_HOSTS:
+        hosts += ["127.0.0.1:*", "localhost:*", "[::1]:*"]
+    if not hosts:
+        return TransportSecuritySettings(enable_dns_rebinding_protection=False)
+    return TransportSecuritySettings(
+        enable_dns_rebinding_protection=True, allowed_hosts=hosts,
+        allowed_origins=[f"{scheme}://{allowed}" for allowed in hosts for scheme in ("http", "https")])
+
+def parse_args(argv=None):
+    """Read server options from the command line, falling back to STUDY_* env vars"""
+    parser = argparse.ArgumentParser(description="Study Helper MCP server")
+    parser.add_argument("--transport", choices=["stdio", "sse", "streamable-http"],
+                        default=os.environ.get("STUDY_TRANSPORT", "stdio"),
+                        help="stdio serves one client; sse and streamable-http serve many from one process")
+    parser.add_argument("--host", default=os.environ.get("STUDY_HOST", "127.0.0.1"),
+                        help="interface to bind for HTTP transports")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("STUDY_PORT", "8000")),
+                        help="port to bind for HTTP transports")
+    parser.add_argument("--allowed-hosts", default=os.environ.get("STUDY_ALLOWED_HOSTS", ""),
+                        help="comma-separated Host headers HTTP clients may use, e.g. study,192.0.2.2:8000 "
+                             "(default: localhost only on a loopback bind, any host otherwise)")
+    parser.add_argument("--reload-interval", type=float,
+                        default=float(os.environ.get("STUDY_RELOAD_INTERVAL", "2")),
+                        help="seconds between checks of STUDY_DATA_DIR/STUDY_QUESTION_DB for changes (0 disables)")
+    parser.add_argument("--metrics-file", default=METRICS_FILE, metavar="PATH",
+                        help="write Prometheus-format metrics to PATH on server_stats calls and at exit")
+    parser.add_argument("--export-data", metavar="DIR",
+                        help="write the current questions and resources as JSON data files to DIR and exit")
+    parser.add_argument("--build-snapshot", metavar="PATH",
+                        help="write a startup snapshot of the question data to PATH and exit")
+    parser.add_argument("--max-concurrency", type=int,
+                        default=int(os.environ.get("STUDY_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)),
+                        help="maximum tool calls running at once; extra calls wait their turn")
+    args = parser.parse_args(argv)
+    args.allowed_hosts = [host.strip() for host in args.allowed_hosts.split(",") if host.strip()]
+    if args.max_concurrency < 1:
+        parser.error("--max-concurrency must be at least 1")
+    return args
+
+def main(argv=None):
+    global tool_slots, METRICS_FILE
+    args = parse_args(argv)
+    if args.export_data:
+        write_data_files(args.export_data)
+        logger.info("Wrote questions.json and resources.json to %s", args.export_data)
+        return 0
+    if args.build_snapshot:
+        write_snapshot(args.build_snapshot)
+        logger.info("Wrote startup snapshot to %s", args.build_snapshot)
+        return 0
+    
+    tool_slots = anyio.CapacityLimiter(args.max_concurrency)
+    METRICS_FILE = args.metrics_file
+    if METRICS_FILE:
+        atexit.register(tool_metrics.dump, METRICS_FILE)
+    mcp.settings.host = args.host
+    mcp.settings.port = args.port
+    security = transport_security(args.host, args.allowed_hosts)
+    if security is not None:
+        mcp.settings.transport_security = security
+        if args.transport != "stdio" and not security.enable_dns_rebinding_protection:
+            logger.warning("Accepting any Host header on %s; set --allowed-hosts to restrict it", args.host)
+    # Built-in data never changes while the server runs, so only watch data files
+    if args.reload_interval > 0 and any(signature[0] != "builtin" for signature in knowledge.source):
+        KnowledgeReloader(args.reload_interval).start()
+    
+    if args.transport == "stdio":
+        logger.info("Starting Study Helper MCP server...")
+    else:
+        logger.info("Starting Study Helper MCP server (%s on %s:%d, max %d concurrent tool calls)...",
+                    args.transport, args.host, args.port, args.max_concurrency)
+    startup_timings["server_ready"] = time.perf_counter() - STARTUP_BEGIN
+    logger.info("Startup timing: imports %.1f ms, data load %.1f ms (%s), server ready %.1f ms",
+                startup_timings["imports"] * 1000, startup_timings["data_load"] * 1000,
+                knowledge_origin, startup_timings["server_ready"] * 1000)
     
     try:
-        mcp.run(transport='stdio')
+        mcp.run(transport=args.transport)
     except Exception as e:
         logger.error(f"Server error: {e}", exc_info=True)
-        sys.exit(1)
\ No newline at end of file
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""
+Tests for session sampling, cursor validation and quiz grading
+
+Run from Custom-MCP: python -m pytest -q tests
+"""
+import os
+import sys
+import json
+import base64
+import random
+import asyncio
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import study_server  # noqa: E402
+from study_server import (  # noqa: E402
+    MAX_QUESTIONS, LazyPermutation, SessionSampler, content_question_id, decode_cursor,
+    encode_cursor, grade_matrix, parse_submissions,
+)
+
+# --- Session sampling ---
+
+def test_lazy_permutation_is_deterministic_for_a_seed():
+    first = LazyPermutation(1000, random.Random("seed")).draw(100)
+    second = LazyPermutation(1000, random.Random("seed")).draw(100)
+    assert first == second
+
+def test_lazy_permutation_covers_the_bank_before_repeating():
+    permutation = LazyPermutation(50, random.Random(1))
+    drawn = []
+    while len(drawn) < 50:
+        drawn += permutation.draw(7)
+    assert sorted(drawn[:50]) == list(range(50))
+    # The second pass is a fresh permutation of the whole bank
+    second = drawn[50:] + permutation.draw(50 - len(drawn[50:]))
+    assert sorted(second) == list(range(50))
+
+def test_session_sampler_repeats_the_same_order_for_a_session():
+    first = SessionSampler().draw("alice", "math", "easy", (20, 0), 20)
+    second = SessionSampler().draw("alice", "math", "easy", (20, 0), 20)
+    other = SessionSampler().draw("bob", "math", "easy", (20, 0), 20)
+    assert first == second
+    assert other != first
+
+def test_session_sampler_never_repeats_within_a_session():
+    sampler = SessionSampler()
+    drawn = []
+    for _ in range(6):
+        drawn += sampler.draw("alice", "science", "medium", (30, 0), 5)
+    assert sorted(drawn) == list(range(30))
+
+def test_session_sampler_draws_stored_questions_first():
+    sampler = SessionSampler()
+    drawn = []
+    for _ in range(21):
+        drawn += sampler.draw("alice", "math", "easy", (5, 100), 5)
+    assert sorted(drawn[:5]) == list(range(5))
+    assert sorted(drawn[5:]) == list(range(5, 105))
+
+# --- Cursor validation ---
+
+def raw_cursor(*fields):
+    return base64.urlsafe_b64encode(json.dumps(list(fields)).encode("utf-8")).decode("ascii")
+
+def test_cursor_round_trip():
+    cursor = encode_cursor("math", "hard", 40, 1234, 10, False)
+    assert decode_cursor(cursor) == ("math", "hard", 40, 1234, 10, False)
+
+def test_cursor_total_is_clamped_to_max_questions():
+    cursor = encode_cursor("math", "easy", 10**9, 1, 0)
+    assert decode_cursor(cursor)[2] == MAX_QUESTIONS
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor",
+    raw_cursor("math", "easy", 40, 1, 0),                  # too few fields
+    raw_cursor("math", "easy", "40", 1, 0, True),          # total is a string
+    raw_cursor("math", "easy", 40, 1.5, 0, True),          # seed is a float
+    raw_cursor("math", "easy", True, 1, 0, True),          # bools are not counts
+    raw_cursor("math", "easy", 40, 1, 0, 1),               # show_answers is not a bool
+    raw_cursor(["math"], "easy", 40, 1, 0, True),          # topic is not a string
+    raw_cursor("math", "easy", 0, 1, 0, True),             # empty set
+    raw_cursor("math", "easy", 40, 1, 40, True),           # offset past the end
+    raw_cursor("math", "easy", 40, 1, -1, True),           # negative offset
+])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+# --- Grading ---
+
+def test_parse_submissions_pads_and_blanks_invalid_letters():
+    submissions = parse_submissions("Sam: A,x,C; b d", 4)
+    assert submissions == [("Sam", ["A", "", "C", ""]), ("Student 2", ["B", "D", "", ""])]
+
+def test_parse_submissions_ignores_extra_answers():
+    assert parse_submissions("ABCDA", 3) == [("Student 1", ["A", "B", "C"])]
+
+def test_grade_matrix_without_numpy_matches_numpy(monkeypatch):
+    key = ["A", "B", "C"]
+    submissions = [["A", "B", "C"], ["A", "", "D"], ["B", "B", "C"]]
+    with_numpy = grade_matrix(key, submissions)
+    monkeypatch.setattr(study_server, "has_numpy", lambda: False)
+    assert grade_matrix(key, submissions) == with_numpy
+    rows, scores, per_question = with_numpy
+    assert rows[1] == [True, False, False]
+    assert scores == [3, 1, 2]
+    assert per_question == pytest.approx([2 / 3, 2 / 3, 2 / 3])
+
+def stored_quiz(count=3):
+    """Question IDs and correct letters of the first few stored science questions"""
+    questions = study_server.knowledge.store.fetch("science", "easy", list(range(count)))
+    return ([content_question_id(q_data) for q_data in questions],
+            [chr(65 + q_data[2]) for q_data in questions])
+
+def test_grade_quiz_all_correct():
+    ids, letters = stored_quiz()
+    result = asyncio.run(study_server.grade_quiz(",".join(ids), ",".join(letters)))
+    assert f"Score: {len(ids)}/{len(ids)}" in result
+    assert "All answers correct" in result
+
+def test_grade_quiz_class_summary_lists_each_student():
+    ids, letters = stored_quiz()
+    wrong = ["B" if letter == "A" else "A" for letter in letters]
+    result = asyncio.run(study_server.grade_quiz(
+        ",".join(ids), f"Sam: {''.join(letters)}; Lee: {''.join(wrong)}"))
+    assert "Sam: 3/3 - all correct" in result
+    assert "Lee: 0/3 - missed 1, 2, 3" in result
+
+@pytest.mark.parametrize("quiz, answers, message", [
+    ("", "A", "specify a quiz ID"),
+    ("quiz_%%%", "A", "specify a quiz ID"),
+    ("deadbeef0000", "A", "Unknown question IDs"),
+])
+def test_grade_quiz_reports_bad_input(quiz, answers, message):
+    assert message in asyncio.run(study_server.grade_quiz(quiz, answers))
+
+def test_grade_quiz_requires_answers():
+    ids, _ = stored_quiz()
+    assert asyncio.run(study_server.grade_quiz(",".join(ids), "")).startswith("Error:")